@@ -0,0 +1,96 @@
+"""
+Benchmark of reading a band selection of a multi-band image.
+
+Reads the RGB bands of a 16 band, 8x8 tile image whose tiles come from a local http server honouring the
+bands query of the tile urls, once with the selection sliced from tiles of every band (the previous
+behaviour, GEOGENIUS_BAND_QUERY off) and once with the tile reads asking for the selected bands only.
+Reports the bytes the server sent and the wall time of each read.
+"""
+import time
+from multiprocessing import Process, Value
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from geogeniustools.examples.tile_decode_benchmark import ThreadingHTTPServer, PORT
+from geogeniustools.images import rda_image
+from geogeniustools.images.rda_image import RDAImage, GraphMeta
+from geogeniustools.rda import cache, interface
+
+BANDS = 16
+TILES = 8
+RGB = [4, 2, 1]
+
+
+def encode(data):
+    with MemoryFile() as memfile:
+        with memfile.open(driver="GTiff", width=data.shape[2], height=data.shape[1], count=data.shape[0],
+                          dtype=data.dtype, transform=from_origin(116.0, 40.0, 1e-4, 1e-4), crs="EPSG:4326") as dst:
+            dst.write(data)
+        return memfile.read()
+
+
+def serve(sent):
+    data = np.random.randint(0, 4096, size=(BANDS, 256, 256)).astype(np.uint16)
+    bodies = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            bands = parse_qs(urlparse(self.path).query).get("bands", [None])[0]
+            if bands not in bodies:
+                bodies[bands] = encode(data if bands is None else data[[int(b) for b in bands.split(",")]])
+            body = bodies[bands]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/tiff")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with sent.get_lock():
+                sent.value += len(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer(("127.0.0.1", PORT), Handler).serve_forever()
+
+
+def scene(graph_id):
+    size = TILES * 256
+    op = GraphMeta(graph_id, node_id="node")
+    op._graph = {"nodes": []}
+    op._interface = type("Interface", (), {"get_token": lambda self: "token"})()
+    op._rda_meta = {
+        "image": {"minX": 0, "maxX": size - 1, "minY": 0, "maxY": size - 1, "tileXSize": 256, "tileYSize": 256,
+                  "minTileX": 0, "maxTileX": TILES - 1, "minTileY": 0, "maxTileY": TILES - 1, "numBands": BANDS,
+                  "dataType": "uint16"},
+        "georef": {"translateX": 116.0, "scaleX": 1e-4, "shearX": 0, "translateY": 40.0, "shearY": 0,
+                   "scaleY": -1e-4, "spatialReferenceSystemCode": "EPSG:4326"}}
+    return RDAImage(op)
+
+
+def run(label, band_query, sent):
+    rda_image.BAND_QUERY = band_query
+    sent.value = 0
+    start = time.time()
+    data = scene(label).read(bands=RGB)
+    elapsed = time.time() - start
+    print("{:<12} {} read, {:.1f} MB sent, {:.2f} s".format(label, data.shape, sent.value / 1e6, elapsed))
+
+
+if __name__ == '__main__':
+    sent = Value("q", 0)
+    server = Process(target=serve, args=(sent,), daemon=True)
+    server.start()
+    time.sleep(1)
+    interface.RDA_ENDPOINT = "http://127.0.0.1:{}".format(PORT)
+    cache.set_memory_cache(None)
+    try:
+        run("all-bands", False, sent)
+        run("band-query", True, sent)
+    finally:
+        server.terminate()
@@ -0,0 +1,46 @@
+"""
+Benchmark of the "easy" and "multi" tile fetch engines.
+
+Reads a 20x20 tile image whose tiles come from a local http server answering every request after
+a fixed latency, which is what bounds throughput against a remote RDA endpoint. The "easy" engine
+has at most GEOGENIUS_THREADS requests in flight, the "multi" engine prefetches every tile of the
+read over a CurlMulti.
+"""
+import os
+import time
+from multiprocessing import Process
+
+import dask.array as da
+
+from geogeniustools.examples.tile_decode_benchmark import make_tile, serve, PORT
+from geogeniustools.images.meta import DaskImage
+from geogeniustools.rda import cache
+
+LATENCY = float(os.environ.get("BENCHMARK_LATENCY", 0.05))
+TILES = int(os.environ.get("BENCHMARK_TILES", 20))
+THREADS = int(os.environ.get("GEOGENIUS_THREADS", 8))
+
+
+def image(engine):
+    url = "http://127.0.0.1:{}/rda/read/{}/node/{}/{}.TIF"
+    dsk = {("image", 0, y, x): (cache.load_tile, cache.tile_key(engine, "node", x, y),
+                                url.format(PORT, engine, x, y), "token", (8, 256, 256))
+           for y in range(TILES) for x in range(TILES)}
+    chunks = ((8,), (256,) * TILES, (256,) * TILES)
+    return DaskImage(da.Array(dsk, "image", chunks, dtype="uint16"))
+
+
+if __name__ == '__main__':
+    server = Process(target=serve, args=(make_tile(), LATENCY), daemon=True)
+    server.start()
+    time.sleep(1)
+    cache.set_memory_cache(None)
+    try:
+        for engine in ("easy", "multi"):
+            cache.set_fetch_engine(engine)
+            start = time.time()
+            image(engine).read()
+            elapsed = time.time() - start
+            print("{:<6} {:>8.1f} tiles/s".format(engine, TILES * TILES / elapsed))
+    finally:
+        server.terminate()
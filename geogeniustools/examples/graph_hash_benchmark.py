@@ -0,0 +1,30 @@
+"""
+Benchmark of building RDA operator graphs of 10, 100 and 1000 nodes.
+
+Builds a chain where every op is applied to the previous one, and a mosaic applied to many
+GdalImageRead inputs, without registering them.
+"""
+import time
+
+from geogeniustools.rda.interface import Op
+
+
+def chain(n):
+    op = Op("GdalImageRead")(path="obs://bucket/image.tif")
+    for i in range(n - 1):
+        op = Op("Reproject")(op, **{"Dest SRS Code": "EPSG:{}".format(32600 + i)})
+    return op
+
+
+def mosaic(n):
+    reads = [Op("GdalImageRead")(path="obs://bucket/image-{}.tif".format(i)) for i in range(n - 1)]
+    return Op("Mosaic")(*reads, pixel_selection="first")
+
+
+if __name__ == '__main__':
+    for build in (chain, mosaic):
+        for n in (10, 100, 1000):
+            start = time.time()
+            op = build(n)
+            op._id
+            print("{:<7} {:>5} nodes {:>10.1f} ms".format(build.__name__, n, (time.time() - start) * 1000))
@@ -0,0 +1,70 @@
+"""
+Benchmark of reading AOIs that straddle the edges of an image.
+
+Pads windows hanging over each corner and over the whole image, once with the per side
+da.concatenate of zero blocks (the previous behaviour) and once with GeoDaskImage._slice_padded.
+Reports the tasks in the culled graph, the number of chunks, and the time to read the window and to read
+it rechunked to 256x256 blocks. The image is an in-memory array, so times only cover the graph.
+"""
+import time
+
+import dask.array as da
+import numpy as np
+from affine import Affine
+from dask import optimization
+from dask.core import flatten
+from shapely.geometry import box, mapping
+
+from geogeniustools.images.meta import GeoDaskImage
+from geogeniustools.rda.util import AffineTransform
+
+SIZE = 4096
+TILE = 256
+BANDS = 4
+
+
+def concatenated(img, _bounds):
+    pads = (max(-_bounds[0], 0), max(-_bounds[1], 0),
+            max(_bounds[2] - img.shape[2], 0), max(_bounds[3] - img.shape[1], 0))
+    bounds = (max(_bounds[0], 0), max(_bounds[1], 0),
+              max(min(_bounds[2], img.shape[2]), 0), max(min(_bounds[3], img.shape[1]), 0))
+    result = img[:, bounds[1]:bounds[3], bounds[0]:bounds[2]]
+    for axis, before, after in ((2, pads[0], pads[2]), (1, pads[1], pads[3])):
+        for pad, first in ((before, True), (after, False)):
+            if pad > 0:
+                dims = list(result.shape)
+                dims[axis] = pad
+                zeros = da.zeros(dims, chunks=dims, dtype=result.dtype)
+                result = da.concatenate([zeros, result] if first else [result, zeros], axis=axis)
+    return result
+
+
+def padded(img, bounds):
+    return img._slice_padded(bounds)[0]
+
+
+def read_time(arr):
+    start = time.time()
+    arr.compute(scheduler="threads")
+    return (time.time() - start) * 1000
+
+
+if __name__ == '__main__':
+    data = np.random.randint(0, 4096, size=(BANDS, SIZE, SIZE)).astype(np.uint16)
+    img = GeoDaskImage(da.from_array(data, chunks=(BANDS, TILE, TILE)),
+                       __geo_transform__=AffineTransform(Affine.identity(), "EPSG:4326"),
+                       __geo_interface__=mapping(box(0, 0, SIZE, SIZE)))
+    windows = {
+        "top-left": (-500, -500, 1500, 1500),
+        "bottom-right": (SIZE - 1500, SIZE - 1500, SIZE + 500, SIZE + 500),
+        "whole+margin": (-300, -300, SIZE + 300, SIZE + 300),
+    }
+    for label, bounds in windows.items():
+        for method in (concatenated, padded):
+            arr = method(img, bounds)
+            tasks = len(optimization.cull(arr.__dask_graph__(), list(flatten(arr.__dask_keys__())))[0])
+            chunks = len(arr.chunks[1]) * len(arr.chunks[2])
+            plain = read_time(arr)
+            rechunked = read_time(arr.rechunk((BANDS, TILE, TILE)))
+            print("{:<13} {:<12} {:>6} tasks {:>5} chunks {:>9.1f} ms read {:>9.1f} ms rechunked".format(
+                label, method.__name__, tasks, chunks, plain, rechunked))
@@ -0,0 +1,94 @@
+"""
+Benchmark of GeogeniusSession with and without connection pooling.
+
+Runs a stub of the user, catalog and RDA metadata services in a child process and measures the
+per-request latency of Catalog.get and get_rda_metadata, once with client=requests (a new
+connection per request, the previous default) and once with the pooled requests.Session.
+"""
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing import Process
+from socketserver import ThreadingMixIn
+
+PORT = int(os.environ.get("BENCHMARK_PORT", 8767))
+REQUESTS = int(os.environ.get("BENCHMARK_REQUESTS", 500))
+
+ENDPOINT = "http://127.0.0.1:{}/v1.0".format(PORT)
+for name in ("USER_ENDPOINT", "MANAGER_ENDPOINT", "RDA_ENDPOINT"):
+    os.environ[name] = ENDPOINT
+os.environ.setdefault("ACCESS_KEY", "ak")
+os.environ.setdefault("SECRET_KEY", "sk")
+
+import requests
+
+from geogeniustools.catalog import Catalog
+from geogeniustools.rda.cache import set_metadata_cache
+from geogeniustools.rda.graph import get_rda_metadata
+from geogeniustools.session import GeogeniusSession
+
+RESPONSES = {
+    "/v1.0/users/credentials/login": {"token": "token"},
+    "/v1.0/users/credentials": {},
+    "/v1.0/catalog/metadata": {"dataId": "OBS1/benchmark", "sourceType": "OBS1", "dataUrl": "obs://bucket/a.tif"},
+    "/v1.0/rda/meta/graph": {"image": {"numBands": 8}, "georef": None},
+}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        body = json.dumps(RESPONSES.get(self.path.split("?")[0], {})).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+def serve():
+    ThreadingHTTPServer(("127.0.0.1", PORT), Handler).serve_forever()
+
+
+def latency(call):
+    call()
+    start = time.time()
+    for i in range(REQUESTS):
+        call()
+    return (time.time() - start) / REQUESTS * 1000
+
+
+if __name__ == '__main__':
+    server = Process(target=serve, daemon=True)
+    server.start()
+    time.sleep(1)
+    # every metadata request goes to the service, not the metadata cache
+    set_metadata_cache(None)
+    try:
+        for label, client in (("new connection", requests), ("pooled", None)):
+            session = GeogeniusSession(client=client, access_key="ak", secret_key="sk")
+            catalog = Catalog()
+            catalog.geogenius_connection = session
+            print("{:<16} Catalog.get {:>6.2f} ms   get_rda_metadata {:>6.2f} ms".format(
+                label,
+                latency(lambda: catalog.get("OBS1/benchmark")),
+                latency(lambda: get_rda_metadata(session, "graph"))))
+    finally:
+        server.terminate()
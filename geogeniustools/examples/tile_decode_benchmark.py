@@ -0,0 +1,92 @@
+"""
+Benchmark of the tile fetch path in load_url.
+
+Serves a synthetic 8 band GeoTIFF tile from a local http server running in a child process and
+fetches it repeatedly with load_url, once decoding through a temporary file (the previous behaviour,
+still used as the fallback) and once decoding in memory. Reports tiles/s and the bytes the client
+process wrote (/proc/self/io wchar, Linux only).
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from geogeniustools.rda.fetch.threaded.libcurl import easy
+
+tiff_imread = easy.tiff_imread
+
+PORT = int(os.environ.get("BENCHMARK_PORT", 8765))
+TILES = int(os.environ.get("BENCHMARK_TILES", 2000))
+THREADS = int(os.environ.get("BENCHMARK_THREADS", 16))
+
+
+def make_tile(bands=8, size=256):
+    data = np.random.randint(0, 4096, size=(bands, size, size)).astype(np.uint16)
+    with MemoryFile() as memfile:
+        with memfile.open(driver="GTiff", width=size, height=size, count=bands, dtype=data.dtype,
+                          transform=from_origin(116.0, 40.0, 1e-4, 1e-4), crs="EPSG:4326") as dst:
+            dst.write(data)
+        return memfile.read()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(body, latency=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/tiff")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer(("127.0.0.1", PORT), Handler).serve_forever()
+
+
+def bytes_written():
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except IOError:
+        return None
+
+
+def run(label, in_memory, offset):
+    easy.tiff_imread = tiff_imread if in_memory else None
+    urls = ["http://127.0.0.1:{}/rda/read/g/n/{}/0.TIF".format(PORT, offset + i) for i in range(TILES)]
+    before = bytes_written()
+    start = time.time()
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(lambda url: easy.load_url(url, "token"), urls))
+    elapsed = time.time() - start
+    after = bytes_written()
+    written = "n/a" if before is None else "{:.1f} MB".format((after - before) / 1e6)
+    print("{:<12} {:>10.1f} tiles/s   written to disk: {}".format(label, TILES / elapsed, written))
+
+
+if __name__ == '__main__':
+    server = Process(target=serve, args=(make_tile(),), daemon=True)
+    server.start()
+    time.sleep(1)
+    try:
+        run("tempfile", False, 0)
+        run("in-memory", True, TILES)
+    finally:
+        server.terminate()
@@ -0,0 +1,52 @@
+"""
+Benchmark of the coordinate transforms behind aoi(bbox=...) and warp().
+
+Reprojects an AOI bbox as aoi() does for projected images, and transforms the 256x256 pixel grid of
+a warp chunk as _transpix does, once building pyproj.Proj objects and calling the legacy
+pyproj.transform on every call (the previous behaviour) and once through the cached Transformer of
+get_transformer. Reports calls per second.
+"""
+import time
+from functools import partial
+
+import numpy as np
+import pyproj
+from shapely import ops
+from shapely.geometry import box
+
+from geogeniustools.rda.util import get_transformer
+
+SRC = "EPSG:4326"
+DST = "EPSG:32650"
+CALLS = 500
+BBOX = box(116.0, 39.0, 116.1, 39.1)
+
+
+def legacy(from_proj, to_proj):
+    return partial(pyproj.transform, pyproj.Proj(init=from_proj), pyproj.Proj(init=to_proj))
+
+
+def cached(from_proj, to_proj):
+    return get_transformer(from_proj, to_proj).transform
+
+
+def aoi(build):
+    ops.transform(build(SRC, DST), BBOX)
+
+
+def warp_chunk(build, grid=np.meshgrid(np.linspace(413000, 422000, 256), np.linspace(4328000, 4317000, 256))):
+    build(DST, SRC)(*grid)
+
+
+def run(label, call, build):
+    start = time.time()
+    for _ in range(CALLS):
+        call(build)
+    elapsed = time.time() - start
+    print("{:<11} {:<7} {:>10.1f} calls/s".format(label, build.__name__, CALLS / elapsed))
+
+
+if __name__ == '__main__':
+    for call in (aoi, warp_chunk):
+        for build in (legacy, cached):
+            run(call.__name__, call, build)
@@ -0,0 +1,54 @@
+"""
+Benchmark of warping a full scene.
+
+Builds a 4096x4096 EPSG:4326 image whose 256x256 tiles are "fetched" by a task that sleeps for the
+latency of a tile request and counts its calls, then warps it to UTM with each resampling method and
+reads the result. Reports the tile fetches against the tiles in the scene, and the wall time of the read.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+from affine import Affine
+from shapely.geometry import box, mapping
+
+from geogeniustools.images.meta import DaskImage, GeoDaskImage
+from geogeniustools.rda.util import AffineTransform
+
+SIZE = 4096
+TILE = 256
+BANDS = 4
+LATENCY = float(os.environ.get("BENCHMARK_LATENCY", 0.02))
+
+fetched = []
+lock = threading.Lock()
+
+
+def fetch_tile(row, col):
+    time.sleep(LATENCY)
+    with lock:
+        fetched.append((row, col))
+    return np.full((BANDS, TILE, TILE), row * 100 + col, dtype=np.uint16)
+
+
+def scene():
+    n = SIZE // TILE
+    dsk = {("scene", 0, row, col): (fetch_tile, row, col) for row in range(n) for col in range(n)}
+    img = DaskImage(dict(dask=dsk, name="scene", chunks=(BANDS, TILE, TILE), dtype="uint16",
+                         shape=(BANDS, SIZE, SIZE)))
+    gsd = 1e-4
+    tfm = Affine(gsd, 0.0, 116.0, 0.0, -gsd, 40.0)
+    return GeoDaskImage(img, __geo_transform__=AffineTransform(tfm, "EPSG:4326"),
+                        __geo_interface__=mapping(box(116.0, 40.0 - SIZE * gsd, 116.0 + SIZE * gsd, 40.0)))
+
+
+if __name__ == '__main__':
+    for resampling in ("nearest", "bilinear", "cubic", "average", "mode"):
+        del fetched[:]
+        warped = scene().warp(proj="EPSG:32650", resampling=resampling)
+        start = time.time()
+        warped.read()
+        elapsed = time.time() - start
+        print("{:<8} {} tiles in scene, {} fetched ({} distinct), warp read in {:.1f} s".format(
+            resampling, (SIZE // TILE) ** 2, len(fetched), len(set(fetched)), elapsed))
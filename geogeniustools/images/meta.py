@@ -7,21 +7,188 @@ from itertools import product
 import dask
 import dask.array as da
 import numpy as np
-import pyproj
 import skimage.transform as tf
 from affine import Affine
 from dask import optimization
+from dask.base import tokenize
+from dask.core import flatten
+from dask.array.optimization import optimize as array_optimize
 from dask.highlevelgraph import HighLevelGraph
 from shapely import ops, wkt
 from shapely.geometry import box, shape, mapping, asShape
 from shapely.geometry.base import BaseGeometry
 
 from geogeniustools.images.mixins import PlotMixin, BandMethodsTemplate, Deprecations
+from geogeniustools.rda.band_math import BandExpression, INDICES
+from geogeniustools.rda.cache import prefetch_tiles
+from geogeniustools.rda.fetch.aio.aiohttp_driver import compute as compute_async, CONCURRENCY
+from geogeniustools.rda.interface import DaskProps, RDATileGraph
 from geogeniustools.rda.io import to_geotiff, to_obstiff
-from geogeniustools.rda.util import AffineTransform, get_proj
+from geogeniustools.rda.util import AffineTransform, approx_transform, get_transformer, resample, RESAMPLING
 
 threads = int(os.environ.get('GEOGENIUS_THREADS', 8))
 threaded_get = partial(dask.threaded.get, num_workers=threads)
+# the reprojection error allowed in warp, in source pixels, 0 reprojects every output pixel exactly
+WARP_ERROR_THRESHOLD = float(os.environ.get('GEOGENIUS_WARP_ERROR_THRESHOLD', 0.125))
+# how many partial results of blocks are merged by each task of stats() and histogram()
+MERGE_SPLIT = 32
+
+
+def optimize(dsk, keys, **kwargs):
+    """ Optimizes the graph like any dask array and starts prefetching the tiles it reads """
+    # cull first, the array optimizations would otherwise materialize every lazy tile layer
+    dsk, _ = optimization.cull(dsk, list(flatten(keys)))
+    prefetch_tiles(dsk)
+    return array_optimize(dsk, keys, **kwargs)
+
+
+def is_lazy(dsk):
+    """ Tells if a graph has layers that build their tasks on lookup, like RDATileGraph """
+    layers = getattr(dsk, "layers", {})
+    return any(isinstance(getattr(layer, "mapping", layer), RDATileGraph) for layer in layers.values())
+
+
+def _padded_axis(start, stop, chunks):
+    """
+    Splits the window [start, stop) of an axis into output blocks and locates their source blocks
+
+    The output blocks end on the block edges of the axis, which are extended past both ends of the
+    axis by the size of its first block, so the padded window keeps the chunk grid of the image.
+
+    Returns:
+        list: (size, pieces) for each output block, where pieces are (source block index, source start,
+            source stop, output start, output stop) tuples of the source blocks it copies from
+    """
+    edges = np.cumsum((0,) + tuple(chunks))
+    size, step = int(edges[-1]), chunks[0]
+    lines = set(int(e) for e in edges if start < e < stop)
+    lines.update(range(-step, start, -step))
+    lines.update(range(size + step, stop, step))
+    bounds = [start] + sorted(lines) + [stop]
+    return [(hi - lo, _axis_pieces(lo, hi, edges)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def _axis_pieces(start, stop, edges):
+    """ Returns the (source block index, source start, source stop, output start, output stop) pieces
+    of the blocks between edges that the window [start, stop) of an axis reads, output offsets from start """
+    pieces = []
+    for k, (edge_lo, edge_hi) in enumerate(zip(edges[:-1], edges[1:])):
+        src_lo, src_hi = max(start, edge_lo), min(stop, edge_hi)
+        if src_lo < src_hi:
+            pieces.append((k, int(src_lo - edge_lo), int(src_hi - edge_lo), int(src_lo - start), int(src_hi - start)))
+    return pieces
+
+
+def _block_placements(row_pieces, col_pieces):
+    """ Pairs the row and column pieces of a window into the placements of _padded_block and the
+    (row, col) indices of the source blocks they read """
+    pieces = list(product(row_pieces, col_pieces))
+    placements = [ys[1:3] + xs[1:3] + ys[3:] + xs[3:] for ys, xs in pieces]
+    return placements, [(ys[0], xs[0]) for ys, xs in pieces]
+
+
+def _padded_block(shape, dtype, fill, placements, *blocks):
+    """ Assembles a block of a padded window from the source blocks it overlaps, fill elsewhere """
+    if len(blocks) == 1 and placements[0][4:] == (0, shape[1], 0, shape[2]):
+        sy0, sy1, sx0, sx1 = placements[0][:4]
+        return blocks[0][:, sy0:sy1, sx0:sx1]
+    out = np.full(shape, fill, dtype=dtype)
+    for (sy0, sy1, sx0, sx1, y0, y1, x0, x1), block in zip(placements, blocks):
+        out[:, y0:y1, x0:x1] = block[:, sy0:sy1, sx0:sx1]
+    return out
+
+
+def _band_nodata(nodata, bands):
+    """ The nodata of an image as a tuple with a value per band, None when it has none """
+    if nodata is None:
+        return None
+    return tuple(np.broadcast_to(np.asarray(nodata, dtype=np.float64), (bands,)).tolist())
+
+
+def _valid_block(block, nodata=None):
+    """ True for the pixels of a block that are not nodata, given as a (bands, 1, 1) array, or NaN """
+    valid = np.ones(block.shape, dtype=bool) if nodata is None else block != nodata
+    if block.dtype.kind == "f":
+        valid &= ~np.isnan(block)
+    return valid
+
+
+def _mean_2x2(block, out_dtype, nodata=None):
+    """ Averages the valid 2x2 pixels of a block, its last row and column repeated when they are odd,
+    pixels with none valid being nodata """
+    if block.shape[1] % 2 or block.shape[2] % 2:
+        block = np.pad(block, ((0, 0), (0, block.shape[1] % 2), (0, block.shape[2] % 2)), mode="edge")
+    bands, height, width = block.shape
+    if nodata is None:
+        mean = block.reshape(bands, height // 2, 2, width // 2, 2).mean(axis=(2, 4))
+    else:
+        nodata = np.reshape(nodata, (-1, 1, 1))
+        valid = _valid_block(block, nodata).reshape(bands, height // 2, 2, width // 2, 2)
+        total = np.where(valid, block.reshape(valid.shape), 0).sum(axis=(2, 4), dtype=np.float64)
+        count = valid.sum(axis=(2, 4))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, nodata)
+    if np.issubdtype(out_dtype, np.integer):
+        mean = np.rint(mean)
+    return mean.astype(out_dtype)
+
+
+def _expr_block(block, expression, out_dtype, nodata=None):
+    """ Evaluates a band math expression on a block of the bands it uses, NaN, or 0 for integer dtypes,
+    where any of them is nodata """
+    work = block.dtype if block.dtype == np.float64 else np.float32
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = expression.evaluate(dict(zip(expression.bands, block.astype(work))))
+    out = np.where(_valid_block(block, None if nodata is None else np.reshape(nodata, (-1, 1, 1))).all(axis=0),
+                   out, np.nan if out_dtype.kind == "f" else 0)
+    return out.astype(out_dtype)[None, :, :]
+
+
+def _valid_pixels(block, nodata=None):
+    """ Returns the pixels of a block as (bands, pixels) with a mask of the ones that are not nodata or NaN """
+    data = block.reshape(block.shape[0], -1)
+    return data, _valid_block(data, None if nodata is None else np.reshape(nodata, (-1, 1)))
+
+
+def _block_stats(block, nodata=None):
+    """ The count, min, max, mean and sum of squared deviations of the valid pixels of every band """
+    data, valid = _valid_pixels(block, nodata)
+    count = valid.sum(axis=1)
+    values = np.where(valid, data, 0).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = values.sum(axis=1) / count
+    m2 = (np.where(valid, values - mean[:, None], 0) ** 2).sum(axis=1)
+    return {"count": count,
+            "min": np.where(valid, data, np.inf).min(axis=1),
+            "max": np.where(valid, data, -np.inf).max(axis=1),
+            "mean": np.nan_to_num(mean),
+            "m2": m2}
+
+
+def _merge_stats(parts):
+    """ Merges partial stats, the means and squared deviations as in Chan et al.'s parallel variance """
+    merged = parts[0]
+    for part in parts[1:]:
+        count = merged["count"] + part["count"]
+        delta = part["mean"] - merged["mean"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(count > 0, part["count"] / count, 0)
+        merged = {"count": count,
+                  "min": np.minimum(merged["min"], part["min"]),
+                  "max": np.maximum(merged["max"], part["max"]),
+                  "mean": merged["mean"] + delta * weight,
+                  "m2": merged["m2"] + part["m2"] + delta ** 2 * merged["count"] * weight}
+    return merged
+
+
+def _block_histogram(block, bins, ranges, nodata=None):
+    """ The histogram of the valid pixels of every band, over the range of the band """
+    data, valid = _valid_pixels(block, nodata)
+    return np.stack([np.histogram(band[ok], bins, tuple(rng))[0] for band, ok, rng in zip(data, valid, ranges)])
+
+
+def _merge_histograms(parts):
+    return np.sum(parts, axis=0)
 
 
 class DaskMeta(namedtuple("DaskMeta", ["dask", "name", "chunks", "dtype", "shape"])):
@@ -29,7 +196,11 @@ class DaskMeta(namedtuple("DaskMeta", ["dask", "name", "chunks", "dtype", "shape
 
     @classmethod
     def from_darray(cls, darr, new=tuple.__new__, len=len):
-        dsk, _ = optimization.cull(darr.dask, darr.__dask_keys__())
+        if is_lazy(darr.dask):
+            # culling would build a task for every tile in the array, leave it to compute time
+            dsk = darr.dask
+        else:
+            dsk, _ = optimization.cull(darr.dask, darr.__dask_keys__())
         itr = [dsk, darr.name, darr.chunks, darr.dtype, darr.shape]
         return cls._make(itr)
 
@@ -42,6 +213,7 @@ class DaskImage(da.Array):
     """
     A DaskImage is a 2 or 3 dimension dask array that contains implements the `__daskmeta__` interface.
     """
+    __dask_optimize__ = staticmethod(optimize)
 
     def __new__(cls, dm, **kwargs):
         if isinstance(dm, da.Array):
@@ -50,7 +222,7 @@ class DaskImage(da.Array):
             dm = DaskMeta(**dm)
         elif isinstance(dm, DaskMeta):
             pass
-        elif dm.__class__.__name__ in ("Op", "GraphMeta"):
+        elif isinstance(dm, DaskProps):
             itr = [dm.dask, dm.name, dm.chunks, dm.dtype, dm.shape]
             dm = DaskMeta._make(itr)
         else:
@@ -62,6 +234,8 @@ class DaskImage(da.Array):
             self.__geo_transform__ = kwargs["__geo_transform__"]
         if "__geo_interface__" in kwargs:
             self.__geo_interface__ = kwargs["__geo_interface__"]
+        if "__nodata__" in kwargs:
+            self.__nodata__ = kwargs["__nodata__"]
         return self
 
     @property
@@ -82,6 +256,32 @@ class DaskImage(da.Array):
             arr = self[bands, ...]
         return arr.compute(scheduler=threaded_get)
 
+    async def aread(self, bands=None, window=None, concurrency=CONCURRENCY, session=None):
+        """Reads data from a dask array on the running event loop and returns the computed ndarray
+
+        The tiles covering the selection are fetched concurrently with aiohttp instead of going
+        through dask's threaded scheduler.
+
+        Args:
+            bands (list): band indices to read from the image. Returns bands in the order specified in the list of bands.
+            window (tuple): optional pixel window to read as ((row_start, row_stop), (col_start, col_stop))
+            concurrency (int): the most tile requests in flight for this read
+            session (aiohttp.ClientSession): optional, a session to reuse across reads
+
+        Returns:
+            ndarray: a numpy array of image data
+
+        Example:
+            >>> arr = await img.aread(bands=[2, 1, 0], window=((0, 1024), (0, 1024)))
+        """
+        arr = self
+        if window is not None:
+            (row_start, row_stop), (col_start, col_stop) = window
+            arr = arr[:, row_start:row_stop, col_start:col_stop]
+        if bands is not None:
+            arr = arr[bands, ...]
+        return await compute_async(arr, concurrency=concurrency, session=session)
+
     def randwindow(self, window_shape):
         """Get a random window of a given shape from within an image
 
@@ -184,12 +384,15 @@ class DaskImage(da.Array):
 
 class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
     _default_proj = "EPSG:4326"
+    # the nodata value of every band, None when the image has none
+    __nodata__ = None
 
     def map_blocks(self, *args, **kwargs):
         ''' Queue a deferred function to run on each block of image
 
         This is identical to Dask's map_block functinos, but returns a GeoDaskImage to preserve
-        the geospatial information.
+        the geospatial information. The nodata of the image is kept when the function returns
+        as many bands of the same dtype.
 
         Args: see dask.Array.map_blocks
 
@@ -198,14 +401,45 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
         '''
 
         darr = super(GeoDaskImage, self).map_blocks(*args, **kwargs)
+        same_bands = darr.ndim == self.ndim and darr.shape[0] == self.shape[0] and darr.dtype == self.dtype
         return GeoDaskImage(darr, __geo_interface__=self.__geo_interface__,
-                            __geo_transform__=self.__geo_transform__)
+                            __geo_transform__=self.__geo_transform__,
+                            __nodata__=self.__nodata__ if same_bands else None)
 
     def rechunk(self, *args, **kwargs):
         darr = super(GeoDaskImage, self).rechunk(*args, **kwargs)
         return GeoDaskImage(darr, __geo_interface__=self.__geo_interface__,
+                            __geo_transform__=self.__geo_transform__, __nodata__=self.__nodata__)
+
+    def valid_mask(self, nodata=None):
+        """ A lazy mask of the pixels that are neither nodata nor NaN, computed with every block as it is read
+
+        Args:
+            nodata: optional. A value, or a value per band, used instead of the nodata of the image
+
+        Returns:
+            GeoDaskImage: a boolean image of the same shape, True where pixels are valid
+        """
+        nodata = self.__nodata__ if nodata is None else _band_nodata(nodata, self.shape[0])
+        if nodata is None:
+            valid = da.ones(self.shape, dtype=bool, chunks=self.chunks)
+        else:
+            valid = self != np.reshape(nodata, (-1, 1, 1))
+        if self.dtype.kind == "f":
+            valid = valid & ~da.isnan(self)
+        return GeoDaskImage(valid, __geo_interface__=self.__geo_interface__,
                             __geo_transform__=self.__geo_transform__)
 
+    def masked(self, nodata=None):
+        """ The image as lazy masked arrays, the pixels that are not valid masked, see valid_mask()
+
+        Returns:
+            GeoDaskImage: an image whose blocks, and what read() returns, are numpy masked arrays
+        """
+        darr = da.ma.masked_array(self, mask=~self.valid_mask(nodata))
+        return GeoDaskImage(darr, __geo_interface__=self.__geo_interface__,
+                            __geo_transform__=self.__geo_transform__, __nodata__=self.__nodata__)
+
     def asShape(self):
         return asShape(self)
 
@@ -233,6 +467,192 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
         """ The projection of the image """
         return self.__geo_transform__.proj
 
+    def overview(self, level):
+        """ Returns the image decimated by 2 ** level, level 0 being the image itself
+
+        The overview is read from the service when it exposes one at that level, such as the overviews
+        of a cloud optimized geotiff, so only a fraction of the bytes of the image are read. Otherwise it
+        averages 2x2 pixels of the level below, the pyramid being built lazily and kept on the image.
+
+        Args:
+            level (int): the overview level
+
+        Returns:
+            image: a GeoDaskImage of the overview, covering the same bounds
+        """
+        if level == 0:
+            return self
+        overviews = self.__dict__.setdefault("_overviews", {})
+        if level not in overviews:
+            image = self._server_overview(level)
+            if image is None:
+                image = self.overview(level - 1)._halve()
+            overviews[level] = image
+        return overviews[level]
+
+    def at_resolution(self, gsd):
+        """ Returns the coarsest overview whose pixels are no larger than gsd
+
+        Args:
+            gsd (float): the pixel size wanted, in units of the image projection
+
+        Returns:
+            image: a GeoDaskImage of the overview
+        """
+        pixel = abs(self.affine.a)
+        level = int(np.floor(np.log2(gsd / pixel) + 1e-9)) if gsd > pixel else 0
+        return self.overview(level)
+
+    def _server_overview(self, level):
+        """ The overview at level read from the source, None when it has none """
+        return None
+
+    def expr(self, expression, dtype="float32"):
+        """ Lazily evaluates band math on every block, in a single task per block
+
+        Bands are named b0, b1... by their index in the image, e.g. "(b3 - b2) / (b3 + b2)", see
+        rda.band_math for what expressions may hold. numexpr evaluates them when it is installed.
+
+        Args:
+            expression (str): the band math expression
+            dtype (str): optional. The dtype of the result, default is float32
+
+        Returns:
+            GeoDaskImage: a single band image, NaN, or 0 for integer dtypes, where a band used is nodata
+        """
+        expression = BandExpression(expression)
+        dtype = np.dtype(dtype)
+        if not expression.bands or expression.bands[-1] >= self.shape[0]:
+            raise ValueError("{} must use bands of the {} of the image".format(expression, self.shape[0]))
+        src = self[expression.bands, ...]
+        if len(src.chunks[0]) > 1:
+            src = src.rechunk({0: len(expression.bands)})
+        name = "expr-{}".format(tokenize(src.name, expression.source, dtype))
+        darr = da.map_blocks(_expr_block, src, name=name, chunks=((1,),) + src.chunks[1:], dtype=dtype,
+                             expression=expression, out_dtype=dtype, nodata=src.__nodata__)
+        nodata = None if src.__nodata__ is None else (np.nan if dtype.kind == "f" else 0,)
+        return GeoDaskImage(darr, __geo_interface__=self.__geo_interface__,
+                            __geo_transform__=self.__geo_transform__, __nodata__=nodata)
+
+    def index(self, name, dtype="float32"):
+        """ Lazily computes a spectral index, such as "ndvi" or "ndwi", see expr()
+
+        Returns:
+            GeoDaskImage: a single band image of the index
+        """
+        if name.lower() not in INDICES:
+            raise ValueError("Unknown index {}, use one of {}".format(name, ", ".join(sorted(INDICES))))
+        bands, template = INDICES[name.lower()]
+        return self.expr(template.format(*getattr(self, bands)), dtype=dtype)
+
+    def stats(self, level=0, nodata=None, data=None):
+        """ Computes the statistics of every band without reading the whole image into memory
+
+        Every block is summarized as it is read, in parallel, and the summaries are merged.
+
+        Args:
+            level (int): optional. The overview level to compute the statistics on, see overview()
+            nodata: optional. A value, or a value per band, of pixels to leave out, defaults to the
+                nodata of the image
+            data (ndarray): optional. The pixels of the image already read, summarized instead of
+                reading the blocks again
+
+        Returns:
+            dict: "count", "min", "max", "mean" and "std" of the valid pixels, each an ndarray with a value per band
+        """
+        image = self.overview(level) if data is None else self
+        nodata = image.__nodata__ if nodata is None else nodata
+        merged = image._reduce(data, _block_stats, _merge_stats, nodata)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(merged["m2"] / merged["count"])
+        return {"count": merged["count"], "min": merged["min"], "max": merged["max"],
+                "mean": np.where(merged["count"] > 0, merged["mean"], np.nan), "std": std}
+
+    def histogram(self, bins=256, range=None, level=0, nodata=None, data=None):
+        """ Computes the histogram of every band without reading the whole image into memory
+
+        Args:
+            bins (int): optional. The number of equal width bins, default is 256
+            range (tuple): optional. The (lower, upper) range of the bins of all bands, defaults to the
+                min and max of each band, computed with stats() first
+            level (int): optional. The overview level to compute the histogram on, see overview()
+            nodata: optional. A value, or a value per band, of pixels to leave out, defaults to the
+                nodata of the image
+            data (ndarray): optional. The pixels of the image already read, see stats()
+
+        Returns:
+            tuple: the (bands, bins) counts and the (bands, bins + 1) bin edges
+        """
+        image = self.overview(level) if data is None else self
+        nodata = image.__nodata__ if nodata is None else nodata
+        if range is None:
+            stats = image.stats(nodata=nodata, data=data)
+            ranges = np.stack([stats["min"], stats["max"]], axis=1).astype(np.float64)
+            ranges[~np.isfinite(ranges).all(axis=1)] = (0, 1)
+        else:
+            ranges = np.tile(np.asarray(range, dtype=np.float64), (image.shape[0], 1))
+        # np.histogram widens an empty range by half a unit on both sides
+        empty = ranges[:, 0] == ranges[:, 1]
+        ranges[empty] += (-0.5, 0.5)
+        counts = image._reduce(data, _block_histogram, _merge_histograms, bins, ranges, nodata)
+        return counts, np.stack([np.linspace(lower, upper, bins + 1) for lower, upper in ranges])
+
+    def percentiles(self, q, bins=4096, level=0, nodata=None, data=None):
+        """ Approximates percentiles of every band from a histogram, see histogram()
+
+        Args:
+            q (list): the percentiles to compute, between 0 and 100
+            bins (int): optional. The number of bins of the histogram, more bins give closer percentiles
+
+        Returns:
+            ndarray: the (bands, len(q)) percentiles
+        """
+        counts, edges = self.histogram(bins=bins, level=level, nodata=nodata, data=data)
+        cdf = np.concatenate([np.zeros((counts.shape[0], 1)), np.cumsum(counts, axis=1)], axis=1)
+        return np.stack([np.interp(np.asarray(q, dtype=np.float64) / 100.0 * c[-1], c, e) for c, e in zip(cdf, edges)])
+
+    def _reduce(self, data, func, merge, *args):
+        """ Applies func to the blocks of the image, or strips of rows of data when the image has been read,
+        and merges the results """
+        if data is None:
+            return self._reduce_blocks(func, merge, *args)
+        rows = max(self.chunks[1]) if self.ndim == 3 else 256
+        return merge([func(data[:, i:i + rows], *args) for i in range(0, max(data.shape[1], 1), rows)])
+
+    def _reduce_blocks(self, func, merge, *args):
+        """ Applies func to every block with args and merges the results of all blocks, MERGE_SPLIT at a time """
+        image = self if len(self.chunks[0]) == 1 else self.rechunk({0: self.shape[0]})
+        name = "{}-{}".format(func.__name__.strip("_").replace("_", "-"), tokenize(image.name, args))
+        dsk = {}
+        level = []
+        for i, key in enumerate(flatten(image.__dask_keys__())):
+            dsk[(name, 0, i)] = (func, key) + args
+            level.append((name, 0, i))
+        depth = 0
+        while len(level) > 1 or depth == 0:
+            depth += 1
+            groups = [level[i:i + MERGE_SPLIT] for i in range(0, len(level), MERGE_SPLIT)]
+            level = [(name, depth, j) for j in range(len(groups))]
+            dsk.update((key, (merge, group)) for key, group in zip(level, groups))
+        graph = HighLevelGraph.from_collections(name, dsk, dependencies=[image])
+        return threaded_get(optimize(graph, level), level[0])
+
+    def _halve(self):
+        src = self
+        # blocks must have even sizes, but the last, for the halves of the blocks to line up
+        if any(c % 2 for c in self.chunks[1][:-1] + self.chunks[2][:-1]):
+            size = max(self.chunks[1] + self.chunks[2])
+            src = src.rechunk({1: size + size % 2, 2: size + size % 2})
+        # the nodata of every band is handed to the blocks, which must then hold all bands
+        if self.__nodata__ is not None and len(src.chunks[0]) > 1:
+            src = src.rechunk({0: self.shape[0]})
+        chunks = (src.chunks[0], tuple((c + 1) // 2 for c in src.chunks[1]), tuple((c + 1) // 2 for c in src.chunks[2]))
+        darr = da.map_blocks(_mean_2x2, src, chunks=chunks, dtype=self.dtype, out_dtype=self.dtype,
+                             nodata=self.__nodata__)
+        return GeoDaskImage(darr, __geo_interface__=self.__geo_interface__,
+                            __geo_transform__=AffineTransform(self.affine * Affine.scale(2), self.proj),
+                            __nodata__=self.__nodata__)
+
     def aoi(self, **kwargs):
         """ Subsets the Image by the given bounds
 
@@ -327,6 +747,9 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
             'transform': tfm,
             'crs': {'init': self.proj}
         }
+        # a geotiff has a single nodata value for all bands
+        if self.__nodata__ is not None and len(set(self.__nodata__)) == 1:
+            meta['nodata'] = self.__nodata__[0]
         return meta
 
     # def preview(self, **kwargs):
@@ -340,10 +763,22 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
         Args:
             dem (ndarray): optional. A DEM for warping to specific elevation planes
             proj (str): optional. An EPSG proj string to project the image data into ("EPSG:32612")
+            error_threshold (float): optional. The reprojection error allowed in source pixels, the output
+                pixel grid is reprojected exactly only where interpolating it would be off by more
+            resampling (str): optional. How output pixels are sampled from the image, one of "nearest",
+                "bilinear", "cubic" (the default), "average" or "mode". Use "nearest" or "mode" for
+                categorical data, "nearest" being a plain gather of source pixels
+            resolution (float): optional. The output pixel size in units of proj, or an (x, y) pair of sizes.
+                Defaults to the ground sample distance of the image
+            shape (tuple): optional. The (rows, cols) of the output, overriding resolution
 
         Returns:
             daskarray: a warped image as deferred image array
         """
+        resampling = kwargs.get("resampling", "cubic")
+        if resampling not in RESAMPLING:
+            raise ValueError("unsupported resampling {}, expected one of {}".format(resampling, RESAMPLING))
+
         try:
             img_md = self.rda.metadata["image"]
             x_size = img_md["tileXSize"]
@@ -362,18 +797,23 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
             # NOTE: this only works on images that have rda rpcs metadata
             center = wkt.loads(self.rda.metadata["image"]["imageBoundsWGS84"]).centroid
             g = box(*center.buffer(self.rda.metadata["rpcs"]["gsd"] / 2).bounds)
-            tfm = partial(pyproj.transform, pyproj.Proj(init="EPSG:4326"), pyproj.Proj(init=proj))
+            tfm = get_transformer("EPSG:4326", proj).transform
             gsd = kwargs.get("gsd", ops.transform(tfm, g).area ** 0.5)
             current_bounds = wkt.loads(self.rda.metadata["image"]["imageBoundsWGS84"]).bounds
         except (AttributeError, KeyError, TypeError):
-            tfm = partial(pyproj.transform, pyproj.Proj(init=self.proj), pyproj.Proj(init=proj))
+            tfm = get_transformer(self.proj, proj).transform
             gsd = kwargs.get("gsd", (ops.transform(tfm, shape(self)).area / (self.shape[1] * self.shape[2])) ** 0.5)
             current_bounds = self.bounds
 
-        tfm = partial(pyproj.transform, pyproj.Proj(init=from_proj), pyproj.Proj(init=proj))
-        itfm = partial(pyproj.transform, pyproj.Proj(init=proj), pyproj.Proj(init=from_proj))
+        tfm = get_transformer(from_proj, proj).transform
         output_bounds = ops.transform(tfm, box(*current_bounds)).bounds
-        gtf = Affine.from_gdal(output_bounds[0], gsd, 0.0, output_bounds[3], 0.0, -1 * gsd)
+        if kwargs.get("shape") is not None:
+            rows, cols = kwargs["shape"]
+            gsd = ((output_bounds[2] - output_bounds[0]) / cols, (output_bounds[3] - output_bounds[1]) / rows)
+        else:
+            gsd = kwargs.get("resolution") or gsd
+            gsd = tuple(gsd) if isinstance(gsd, (tuple, list)) else (gsd, gsd)
+        gtf = Affine.from_gdal(output_bounds[0], gsd[0], 0.0, output_bounds[3], 0.0, -1 * gsd[1])
 
         ll = ~gtf * (output_bounds[:2])
         ur = ~gtf * (output_bounds[2:])
@@ -381,6 +821,10 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
         y_chunks = int((ll[1] - ur[1]) / y_size) + 1
 
         num_bands = self.shape[0]
+        error_threshold = kwargs.get("error_threshold", WARP_ERROR_THRESHOLD)
+        # each output block reads its source window straight from the source blocks, all bands in one block
+        src = self if len(self.chunks[0]) == 1 else self.rechunk({0: num_bands})
+        row_edges, col_edges = np.cumsum((0,) + src.chunks[1]), np.cumsum((0,) + src.chunks[2])
 
         try:
             dtype = img_md["dataType"]
@@ -388,7 +832,6 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
             dtype = 'uint8'
 
         daskmeta = {
-            "dask": {},
             "chunks": (num_bands, y_size, x_size),
             "dtype": dtype,
             "name": "warp-{}".format(self.name),
@@ -403,57 +846,77 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
 
         full_bounds = box(*output_bounds)
 
-        dasks = []
+        dependencies = [src]
         if isinstance(dem, GeoDaskImage):
             if dem.proj != proj:
                 dem = dem.warp(proj=proj, dem=dem)
-            dasks.append(dem.dask)
-
-        for y in range(y_chunks):
-            for x in range(x_chunks):
-                xmin = x * x_size
-                ymin = y * y_size
-                geometry = px_to_geom(xmin, ymin)
-                daskmeta["dask"][(daskmeta["name"], 0, y, x)] = (self._warp, geometry, gsd, dem, proj, dtype, 5)
-        daskmeta["dask"], _ = optimization.cull(HighLevelGraph.merge(daskmeta["dask"], *dasks),
-                                                list(daskmeta["dask"].keys()))
+            dependencies.append(dem)
+
+        blocks = [(y, x) for y in range(y_chunks) for x in range(x_chunks)]
+        geometries = [px_to_geom(x * x_size, y * y_size) for y, x in blocks]
+        dsk = {}
+        for (y, x), geometry, window in zip(blocks, geometries, self._source_windows(geometries, proj, buf=5)):
+            (row_start, row_stop), (col_start, col_stop) = window
+            placements, sources = _block_placements(_axis_pieces(row_start, row_stop, row_edges),
+                                                    _axis_pieces(col_start, col_stop, col_edges))
+            dsk[(daskmeta["name"], 0, y, x)] = ((self._warp, geometry, gsd, dem, proj, dtype, error_threshold,
+                                                 resampling, window, placements) + tuple((src.name, 0, row, col)
+                                                                                         for row, col in sources))
+        daskmeta["dask"] = HighLevelGraph.from_collections(daskmeta["name"], dsk, dependencies=dependencies)
 
         gi = mapping(full_bounds)
         gt = AffineTransform(gtf, proj)
-        image = GeoDaskImage(daskmeta, __geo_interface__=gi, __geo_transform__=gt)
+        image = GeoDaskImage(daskmeta, __geo_interface__=gi, __geo_transform__=gt, __nodata__=self.__nodata__)
         return image[box(*output_bounds)]
 
-    def _warp(self, geometry, gsd, dem, proj, dtype, buf=0):
-        transpix = self._transpix(geometry, gsd, dem, proj)
-        xmin, xmax, ymin, ymax = (int(max(transpix[0, :, :].min() - buf, 0)),
-                                  int(min(transpix[0, :, :].max() + buf, self.shape[1])),
-                                  int(max(transpix[1, :, :].min() - buf, 0)),
-                                  int(min(transpix[1, :, :].max() + buf, self.shape[2])))
+    def _warp(self, geometry, gsd, dem, proj, dtype, error_threshold, resampling, window, placements, *blocks):
+        transpix = self._transpix(geometry, gsd, dem, proj, error_threshold)
+        (xmin, xmax), (ymin, ymax) = window
         transpix[0, :, :] = transpix[0, :, :] - xmin
         transpix[1, :, :] = transpix[1, :, :] - ymin
-        data = self[:, xmin:xmax, ymin:ymax].compute(scheduler=dask.get)  # read(quiet=True)
+        data = _padded_block((self.shape[0], xmax - xmin, ymax - ymin), self.dtype, 0, placements, *blocks)
 
         if data.shape[1] * data.shape[2] > 0:
-            return np.rollaxis(np.dstack(
-                [tf.warp(data[b, :, :], transpix, preserve_range=True, order=3, mode="edge") for b in
-                 range(data.shape[0])]).astype(dtype), 2, 0)
+            return resample(data, transpix, resampling, dtype=dtype)
         else:
-            return np.zeros((data.shape[0], transpix.shape[1], transpix.shape[2]))
-
-    def _transpix(self, geometry, gsd, dem, proj):
+            return np.zeros((data.shape[0], transpix.shape[1], transpix.shape[2]), dtype=dtype)
+
+    def _source_windows(self, geometries, proj, buf=0, samples=17):
+        """ Returns the ((row start, row stop), (col start, col stop)) window of source pixels each geometry
+        in proj covers, grown by buf pixels and clipped to the image, sampling the geometry bounds on a grid """
+        from_proj = "EPSG:4326" if self.proj is None else self.proj
+        steps = np.linspace(0, 1, samples)
+        bounds = np.asarray([g.bounds for g in geometries], dtype=float).reshape(-1, 4)
+        xv = np.repeat((bounds[:, 0:1] + (bounds[:, 2:3] - bounds[:, 0:1]) * steps)[:, None, :], samples, axis=1)
+        yv = np.repeat((bounds[:, 1:2] + (bounds[:, 3:4] - bounds[:, 1:2]) * steps)[:, :, None], samples, axis=2)
+        cols, rows = ~self.__geo_transform__._affine * get_transformer(proj, from_proj).transform(xv, yv)
+        windows = []
+        for r, c in zip(rows.reshape(len(bounds), -1), cols.reshape(len(bounds), -1)):
+            r, c = r[np.isfinite(r)], c[np.isfinite(c)]
+            if not len(r) or not len(c):
+                windows.append(((0, 0), (0, 0)))
+                continue
+            windows.append(((int(min(max(np.floor(r.min()) - buf, 0), self.shape[1])),
+                             int(min(max(np.ceil(r.max()) + buf + 1, 0), self.shape[1]))),
+                            (int(min(max(np.floor(c.min()) - buf, 0), self.shape[2])),
+                             int(min(max(np.ceil(c.max()) + buf + 1, 0), self.shape[2])))))
+        return windows
+
+    def _transpix(self, geometry, gsd, dem, proj, error_threshold=WARP_ERROR_THRESHOLD):
         xmin, ymin, xmax, ymax = geometry.bounds
-        x = np.linspace(xmin, xmax, num=int((xmax - xmin) / gsd))
-        y = np.linspace(ymax, ymin, num=int((ymax - ymin) / gsd))
-        xv, yv = np.meshgrid(x, y, indexing='xy')
+        gsd_x, gsd_y = gsd if isinstance(gsd, tuple) else (gsd, gsd)
+        x = np.linspace(xmin, xmax, num=int(round((xmax - xmin) / gsd_x)))
+        y = np.linspace(ymax, ymin, num=int(round((ymax - ymin) / gsd_y)))
 
         if self.proj is None:
             from_proj = "EPSG:4326"
         else:
             from_proj = self.proj
 
-        itfm = partial(pyproj.transform, pyproj.Proj(init=proj), pyproj.Proj(init=from_proj))
+        itfm = get_transformer(proj, from_proj).transform
+        iaffine = ~self.__geo_transform__._affine
 
-        xv, yv = itfm(xv, yv)  # if that works
+        xv, yv = approx_transform(itfm, x, y, error_threshold, to_pixels=lambda px, py: iaffine * (px, py))
 
         if isinstance(dem, GeoDaskImage):
             g = box(xv.min(), yv.min(), xv.max(), yv.max())
@@ -465,8 +928,8 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
         if isinstance(dem, np.ndarray):
             dem = tf.resize(np.squeeze(dem), xv.shape, preserve_range=True, order=1, mode="edge")
 
-        coords = self.__geo_transform__.rev(xv, yv, z=dem)[::-1]
-        return np.asarray(coords, dtype=np.int32)
+        coords = self.__geo_transform__.rev(xv, yv, z=dem, rounded=False)[::-1]
+        return np.asarray(coords)
 
     def _parse_geoms(self, **kwargs):
         """ Finds supported geometry types, parses them and returns the bbox """
@@ -491,35 +954,34 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
             from_proj = self._default_proj
         if to_proj is None:
             to_proj = self.proj if self.proj is not None else "EPSG:4326"
-        tfm = partial(pyproj.transform, get_proj(from_proj), get_proj(to_proj))
-        return ops.transform(tfm, geometry)
+        return ops.transform(get_transformer(from_proj, to_proj).transform, geometry)
 
     def _slice_padded(self, _bounds):
-        pads = (max(-_bounds[0], 0), max(-_bounds[1], 0),
-                max(_bounds[2] - self.shape[2], 0), max(_bounds[3] - self.shape[1], 0))
-        bounds = (max(_bounds[0], 0),
-                  max(_bounds[1], 0),
-                  max(min(_bounds[2], self.shape[2]), 0),
-                  max(min(_bounds[3], self.shape[1]), 0))
-        result = self[:, bounds[1]:bounds[3], bounds[0]:bounds[2]]
-        if pads[0] > 0:
-            dims = (result.shape[0], result.shape[1], pads[0])
-            result = da.concatenate([da.zeros(dims, chunks=dims, dtype=result.dtype),
-                                     result], axis=2)
-        if pads[2] > 0:
-            dims = (result.shape[0], result.shape[1], pads[2])
-            result = da.concatenate([result,
-                                     da.zeros(dims, chunks=dims, dtype=result.dtype)], axis=2)
-        if pads[1] > 0:
-            dims = (result.shape[0], pads[1], result.shape[2])
-            result = da.concatenate([da.zeros(dims, chunks=dims, dtype=result.dtype),
-                                     result], axis=1)
-        if pads[3] > 0:
-            dims = (result.shape[0], pads[3], result.shape[2])
-            result = da.concatenate([result,
-                                     da.zeros(dims, chunks=dims, dtype=result.dtype)], axis=1)
-
-        return result, _bounds[0], _bounds[1]
+        _bounds = [int(b) for b in _bounds]
+        if _bounds[0] >= 0 and _bounds[1] >= 0 and _bounds[2] <= self.shape[2] and _bounds[3] <= self.shape[1]:
+            return self[:, _bounds[1]:_bounds[3], _bounds[0]:_bounds[2]], _bounds[0], _bounds[1]
+
+        # a single layer reading the window straight from the image blocks, filled with nodata, or zeros,
+        # outside the image
+        fill = np.zeros((self.shape[0], 1, 1)) if self.__nodata__ is None else np.reshape(self.__nodata__, (-1, 1, 1))
+        if self.dtype.kind != "f":
+            fill = np.nan_to_num(fill)
+        name = "padded-{}".format(tokenize(self.name, _bounds, fill))
+        rows = _padded_axis(_bounds[1], _bounds[3], self.chunks[1])
+        cols = _padded_axis(_bounds[0], _bounds[2], self.chunks[2])
+        band_starts = np.cumsum((0,) + self.chunks[0])
+        dsk = {}
+        for b, num_bands in enumerate(self.chunks[0]):
+            band_fill = fill[band_starts[b]:band_starts[b + 1]]
+            for i, (height, row_pieces) in enumerate(rows):
+                for j, (width, col_pieces) in enumerate(cols):
+                    placements, blocks = _block_placements(row_pieces, col_pieces)
+                    keys = tuple((self.name, b, row, col) for row, col in blocks)
+                    dsk[(name, b, i, j)] = (_padded_block, (num_bands, height, width), self.dtype, band_fill,
+                                            placements) + keys
+        graph = HighLevelGraph.from_collections(name, dsk, dependencies=[self])
+        chunks = (self.chunks[0], tuple(h for h, _ in rows), tuple(w for w, _ in cols))
+        return da.Array(graph, name, chunks, self.dtype), _bounds[0], _bounds[1]
 
     def __contains__(self, g):
         geometry = ops.transform(self.__geo_transform__.rev, g)
@@ -527,6 +989,7 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
         return img_bounds.contains(geometry)
 
     def __getitem__(self, geometry):
+        nodata = self.__nodata__
         if isinstance(geometry, BaseGeometry) or getattr(geometry, "__geo_interface__", None) is not None:
             g = shape(geometry)
             if g.disjoint(shape(self)):
@@ -569,6 +1032,8 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
 
                 g = ops.transform(self.__geo_transform__.fwd, box(xmin, ymin, xmax, ymax))
                 result = super(GeoDaskImage, self).__getitem__(geometry)
+                if nodata is not None:
+                    nodata = tuple(np.atleast_1d(np.asarray(nodata)[band_idx]).tolist())
 
             else:
                 return super(GeoDaskImage, self).__getitem__(geometry)
@@ -576,5 +1041,5 @@ class GeoDaskImage(DaskImage, PlotMixin, BandMethodsTemplate, Deprecations):
         gi = mapping(g)
         gt = self.__geo_transform__ + (xmin, ymin)
         image = super(GeoDaskImage, self.__class__).__new__(self.__class__, result, __geo_interface__=gi,
-                                                            __geo_transform__=gt)
+                                                            __geo_transform__=gt, __nodata__=nodata)
         return image
@@ -11,6 +11,7 @@ except ImportError:
     has_rio = False
 
 import mercantile
+from dask.threaded import get as threaded_get
 from shapely.geometry import box
 
 import numpy as np
@@ -73,18 +74,27 @@ class PlotMixin(object):
         Equalize and the histogram and normalize value range
         Equalization is on all three bands, not per-band
         """
-        data = self._read(self[use_bands, ...], **kwargs)
+        selection = self[use_bands, ...]
+        data = self._read(selection, **kwargs)
+        # the histogram of all three bands, nodata, or zeros, left out, computed from the pixels read, or
+        # streamed from an overview
+        stats_data = None if kwargs.get("stats_level") else data
+        nodata = 0 if selection.__nodata__ is None else selection.__nodata__
+        stats = selection.stats(level=kwargs.get("stats_level", 0), nodata=nodata, data=stats_data)
+        lower, upper = stats["min"].min(), stats["max"].max()
         data = np.rollaxis(data.astype(np.float32), 0, 3)
-        flattened = data.flatten()
-        if 0 in data:
-            masked = np.ma.masked_values(data, 0).compressed()
-            image_histogram, bin_edges = np.histogram(masked, 256)
+        if not np.isfinite([lower, upper]).all():
+            # no valid pixels to equalize, such as a window of nodata only
+            image_equalized = data
         else:
-            image_histogram, bin_edges = np.histogram(flattened, 256)
-        bins = (bin_edges[:-1] + bin_edges[1:]) / 2.0
-        cdf = image_histogram.cumsum()
-        cdf = cdf / float(cdf[-1])
-        image_equalized = np.interp(flattened, bins, cdf).reshape(data.shape)
+            histograms, bin_edges = selection.histogram(bins=256, range=(lower, upper),
+                                                        level=kwargs.get("stats_level", 0), nodata=nodata,
+                                                        data=stats_data)
+            image_histogram = histograms.sum(axis=0)
+            bins = (bin_edges[0, :-1] + bin_edges[0, 1:]) / 2.0
+            cdf = image_histogram.cumsum()
+            cdf = cdf / float(cdf[-1])
+            image_equalized = np.interp(data.flatten(), bins, cdf).reshape(data.shape)
         if 'stretch' in kwargs or 'gamma' in kwargs:
             return self._histogram_stretch(image_equalized, **kwargs)
         else:
@@ -93,10 +103,9 @@ class PlotMixin(object):
     def histogram_match(self, use_bands, blm_source=None, **kwargs):
         """Match the histogram to existing imagery"""
         assert has_rio, "To match image histograms please install rio_hist"
-        data = self._read(self[use_bands, ...], **kwargs)
+        selection = self[use_bands, ...]
+        data = self._read(selection.masked(nodata=0 if selection.__nodata__ is None else None), **kwargs)
         data = np.rollaxis(data.astype(np.float32), 0, 3)
-        if 0 in data:
-            data = np.ma.masked_values(data, 0)
         bounds = self._reproject(box(*self.bounds), from_proj=self.proj, to_proj="EPSG:4326").bounds
         if blm_source == 'browse':
             from geogeniustools.images.browse_image import BrowseImage
@@ -114,26 +123,29 @@ class PlotMixin(object):
 
     def histogram_stretch(self, use_bands, **kwargs):
         """ entry point for contrast stretching """
-        data = self._read(self[use_bands, ...], **kwargs)
+        selection = self[use_bands, ...]
+        data = self._read(selection, **kwargs)
+        # the percentiles are approximated from histograms of the pixels read, or streamed from an overview,
+        # instead of sorting the whole selection
+        limits = selection.percentiles(kwargs.get("stretch", [0, 100]), level=kwargs.get("stats_level", 0),
+                                       data=None if kwargs.get("stats_level") else data)
         data = np.rollaxis(data.astype(np.float32), 0, 3)
-        return self._histogram_stretch(data, **kwargs)
+        return self._histogram_stretch(data, limits=limits, **kwargs)
 
-    def _histogram_stretch(self, data, **kwargs):
+    def _histogram_stretch(self, data, limits=None, **kwargs):
         """ perform a contrast stretch and/or gamma adjustment """
-        limits = {}
-        # get the image min-max statistics
-        for x in range(3):
-            band = data[:, :, x]
-            try:
-                limits[x] = np.percentile(band, kwargs.get("stretch", [0, 100]))
-            except IndexError:
-                # this band has no dynamic range and cannot be stretched
-                return data
+        if limits is None:
+            limits = {}
+            # get the image min-max statistics
+            for x in range(3):
+                band = data[:, :, x]
+                try:
+                    limits[x] = np.percentile(band, kwargs.get("stretch", [0, 100]))
+                except IndexError:
+                    # this band has no dynamic range and cannot be stretched
+                    return data
         # compute the stretch
         for x in range(3):
-            band = data[:, :, x]
-            if 0 in band:
-                band = np.ma.masked_values(band, 0).compressed()
             top = limits[x][1]
             bottom = limits[x][0]
             if top != bottom:  # catch divide by zero
@@ -153,8 +165,7 @@ class PlotMixin(object):
 
         Returns: numpy array with ndvi values
         """
-        data = self._read(self[self._ndvi_bands, ...]).astype(np.float32)
-        return (data[0, :, :] - data[1, :, :]) / (data[0, :, :] + data[1, :, :])
+        return self._read(self.index("ndvi"))[0, :, :]
 
     def ndwi(self):
         """
@@ -163,8 +174,7 @@ class PlotMixin(object):
 
         Returns: numpy array of ndwi values
         """
-        data = self._read(self[self._ndwi_bands, ...]).astype(np.float32)
-        return (data[1, :, :] - data[0, :, :]) / (data[0, :, :] + data[1, :, :])
+        return self._read(self.index("ndwi"))[0, :, :]
 
     def plot(self, spec="rgb", **kwargs):
         """ Plot the image with MatplotLib
@@ -190,6 +200,8 @@ class PlotMixin(object):
             cmap (str): MatPlotLib colormap name to use for single band images. Default is colormap='Grey_R'.
             histogram (str): either 'equalize', 'minmax', 'match', or ignore
             stretch (list): stretch the histogram between two percentile values, default is [2,98]
+            stats_level (int): overview level to stream the stretch and equalization statistics from, default is to
+                compute them from the pixels plotted
             gamma (float): adjust image gamma, default is 1.0
         """
 
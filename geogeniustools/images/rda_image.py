@@ -1,12 +1,24 @@
 import math
+import os
+from copy import deepcopy
+from numbers import Integral
 
+import numpy as np
 import requests
 
-from geogeniustools.images.meta import GeoDaskImage
+from geogeniustools.images.meta import GeoDaskImage, _band_nodata
+from geogeniustools.rda.band_math import BandExpression
+from geogeniustools.rda.error import BadRequest, GraphRejected
 from geogeniustools.rda.graph import get_rda_graph
-from geogeniustools.rda.interface import DaskProps
+from geogeniustools.rda.interface import DaskProps, RDA
 from geogeniustools.rda.util import AffineTransform
 
+# read band selections of images with a bands query, fetching only the bands selected
+BAND_QUERY = os.environ.get("GEOGENIUS_BAND_QUERY", "true").lower() in ("1", "true", "yes")
+# compute band math with RDA operators on the server, turned off for the process once it rejects them
+SERVER_BAND_MATH = os.environ.get("GEOGENIUS_SERVER_BAND_MATH", "true").lower() in ("1", "true", "yes")
+_server_band_math = {"enabled": SERVER_BAND_MATH}
+
 
 class GraphMeta(DaskProps):
     def __init__(self, graph_id, node_id=None, **kwargs):
@@ -36,6 +48,91 @@ class GraphMeta(DaskProps):
         return self._graph
 
 
+def overview_metadata(metadata, factor):
+    """ Derives the metadata of an RDA node read at the overview decimated by factor """
+    metadata = deepcopy(metadata)
+    image = metadata["image"]
+    image.pop("overviews", None)
+    for axis in ("X", "Y"):
+        size = image["tile{}Size".format(axis)]
+        image["min" + axis] = image["min" + axis] // factor
+        image["max" + axis] = image["max" + axis] // factor
+        image["minTile" + axis] = image["min" + axis] // size
+        image["maxTile" + axis] = image["max" + axis] // size
+    if metadata.get("georef") is not None:
+        for key in ("scaleX", "shearX", "shearY", "scaleY"):
+            metadata["georef"][key] *= factor
+    return metadata
+
+
+class OverviewMeta(DaskProps):
+    """ An RDA node read at one of the overview levels the service exposes, decimated by 2 ** level """
+
+    def __init__(self, op, level):
+        self._op = op
+        self._level = level
+        self._rda_id = op._rda_id
+        self._interface = op._interface
+        self._rda_meta = None
+        self._query = "level={}".format(level)
+
+    @property
+    def _id(self):
+        return self._op._id
+
+    def graph(self):
+        return self._op.graph()
+
+    @property
+    def metadata(self):
+        if self._rda_meta is None:
+            self._rda_meta = overview_metadata(self._op.metadata, 2 ** self._level)
+        return self._rda_meta
+
+    @property
+    def name(self):
+        return "image-{}-level{}".format(self._id, self._level)
+
+
+def band_metadata(metadata, bands):
+    """ Derives the metadata of an RDA node read with only some of its bands """
+    metadata = deepcopy(metadata)
+    image = metadata["image"]
+    image["numBands"] = len(bands)
+    if isinstance(image.get("nodata"), list):
+        image["nodata"] = [image["nodata"][band] for band in bands]
+    return metadata
+
+
+class BandSubsetMeta(DaskProps):
+    """ An RDA node read with only some of its bands, which the tile reads ask for with a bands query """
+
+    def __init__(self, op, bands):
+        self._op = op
+        self._bands = tuple(bands)
+        self._rda_id = op._rda_id
+        self._interface = op._interface
+        self._rda_meta = None
+        self._query = "&".join(q for q in (op._query, "bands={}".format(",".join(map(str, self._bands)))) if q)
+
+    @property
+    def _id(self):
+        return self._op._id
+
+    def graph(self):
+        return self._op.graph()
+
+    @property
+    def metadata(self):
+        if self._rda_meta is None:
+            self._rda_meta = band_metadata(self._op.metadata, self._bands)
+        return self._rda_meta
+
+    @property
+    def name(self):
+        return "{}-bands-{}".format(self._op.name, "-".join(map(str, self._bands)))
+
+
 class RDAGeoAdapter(object):
     def __init__(self, metadata, dfp="EPSG:4326"):
         self.md = metadata
@@ -100,19 +197,54 @@ class RDAImage(GeoDaskImage):
     _default_proj = "EPSG:4326"
 
     def __new__(cls, op, **kwargs):
-        cls.__geo__ = RDAGeoAdapter(op.metadata, dfp=cls._default_proj)
-        cls.__geo_transform__ = cls.__geo__.geo_transform
-        # cls.__geo_interface__ = cls.__geo__.geo_interface
-        cls._rda_op = op
-        self = super(RDAImage, cls).__new__(cls, op)
+        geo = RDAGeoAdapter(op.metadata, dfp=cls._default_proj)
+        self = super(RDAImage, cls).__new__(cls, op, __geo_transform__=geo.geo_transform)
+        self.__geo__ = geo
+        self.__nodata__ = _band_nodata(op.metadata["image"].get("nodata"), self.shape[0])
+        self._rda_op = op
         return rda_image_shift(self)
 
     def __getitem__(self, geometry):
+        bands = self._selected_bands(geometry[0]) if isinstance(geometry, tuple) else None
+        spatial = tuple(geometry[1:]) if isinstance(geometry, tuple) else ()
+        if spatial == (Ellipsis,):
+            spatial = (slice(None), slice(None))
+        if bands is not None and not isinstance(geometry[0], Integral) and len(spatial) == 2 and \
+                all(isinstance(s, slice) or s is Ellipsis for s in spatial):
+            subset = self._band_subset(bands)
+            if subset is not None:
+                return subset[(slice(None),) + spatial]
         im = super(RDAImage, self).__getitem__(geometry)
-        if isinstance(im, GeoDaskImage):
-            im._rda_op = self._rda_op
+        if not isinstance(im, GeoDaskImage):
+            return im
+        if bands is not None:
+            # the node no longer describes the bands of the image, which is read as a plain image
+            return GeoDaskImage(im, __geo_interface__=im.__geo_interface__, __geo_transform__=im.__geo_transform__,
+                                __nodata__=im.__nodata__)
+        im.__geo__ = self.__geo__
+        im._rda_op = self._rda_op
         return im
 
+    def _selected_bands(self, index):
+        """ The bands selected by the band index of a slice, None when it selects every band in order """
+        if index is Ellipsis:
+            return None
+        if isinstance(index, slice):
+            bands = list(range(self.shape[0])[index])
+        elif isinstance(index, Integral):
+            bands = [index]
+        elif isinstance(index, (list, tuple, np.ndarray)):
+            bands = list(index)
+        else:
+            bands = [index]
+        return None if bands == list(range(self.shape[0])) else bands
+
+    def _node_bands(self):
+        """ The bands of the node behind rda the image holds, None when rda does not describe them """
+        op = self.rda
+        bands = list(op._bands) if isinstance(op, BandSubsetMeta) else list(range(op.shape[0]))
+        return bands if len(bands) == self.shape[0] else None
+
     @property
     def __daskmeta__(self):
         return self.rda
@@ -138,6 +270,79 @@ class RDAImage(GeoDaskImage):
             else:
                 raise ValueError('Band index is invalid')
 
+    def _server_overview(self, level):
+        if 2 ** level not in self.metadata["image"].get("overviews", []) or self._node_bands() is None:
+            return None
+        if isinstance(self.rda, BandSubsetMeta):
+            op = BandSubsetMeta(OverviewMeta(self.rda._op, level), self.rda._bands)
+        else:
+            op = OverviewMeta(self.rda, level)
+        image = RDAImage(op)
+        return image.aoi(bbox=self.bounds, from_proj=self.proj)
+
+    def _band_subset(self, bands):
+        """ The image read with only some of its bands, None when reading all bands is as good or the
+        selection cannot be read this way """
+        if not BAND_QUERY or not isinstance(bands, (list, tuple, np.ndarray)) or not len(bands) < self.shape[0]:
+            return None
+        if not all(isinstance(band, Integral) and 0 <= band < self.shape[0] for band in bands):
+            return None
+        if self._node_bands() is None:
+            return None
+        op, bands = self.rda, [int(band) for band in bands]
+        if isinstance(op, BandSubsetMeta):
+            op, bands = op._op, [op._bands[band] for band in bands]
+        if getattr(op, "_rda_id", None) is None:
+            return None
+        full = RDAImage(BandSubsetMeta(op, bands))
+        # the window of the image in the node, images padded past the node read all bands
+        col, row = ~full.affine * (self.affine.c, self.affine.f)
+        col, row = int(round(col)), int(round(row))
+        if row < 0 or col < 0 or row + self.shape[1] > full.shape[1] or col + self.shape[2] > full.shape[2]:
+            return None
+        return full[:, row:row + self.shape[1], col:col + self.shape[2]]
+
+    def expr(self, expression, dtype="float32"):
+        """ Lazily evaluates band math, on the server with RDA operators when it supports them
+
+        Only the single band result is then read, instead of every band of every tile. Expressions the
+        operators cannot express, images not built from RDA operators or with nodata, which the operators
+        cannot mask, and servers rejecting the operators fall back to evaluating the expression on the
+        client, see GeoDaskImage.expr().
+        """
+        image = self._server_expr(expression, dtype)
+        if image is None:
+            return super(RDAImage, self).expr(expression, dtype=dtype)
+        return image
+
+    def _server_expr(self, expression, dtype):
+        """ The band math computed by the server, None when it cannot be """
+        # the operators know nothing of nodata, images with nodata are masked on the client
+        if not _server_band_math["enabled"] or self.__nodata__ is not None:
+            return None
+        # band subsets select the bands of the expression from the node they are read from
+        node, bands = self.rda, self._node_bands()
+        if isinstance(node, BandSubsetMeta):
+            node = node._op
+        if bands is None or not hasattr(node, "_nodes"):
+            return None
+        parsed = BandExpression(expression)
+        if not parsed.bands or parsed.bands[-1] >= self.shape[0]:
+            return None
+        try:
+            op = parsed.to_rda(RDA(), node, dtype=dtype, bands=bands)
+        except ValueError:
+            return None
+        try:
+            image = RDAImage(op)
+        except GraphRejected:
+            _server_band_math["enabled"] = False
+            return None
+        except BadRequest:
+            # such as the metadata of the graph failing to load, try again with the next expression
+            return None
+        return image.aoi(bbox=self.bounds, from_proj=self.proj)
+
     @property
     def ntiles(self):
         size = float(self.rda.metadata['image']['tileXSize'])
@@ -0,0 +1,155 @@
+"""
+Band math expressions, such as "(b3 - b2) / (b3 + b2)", evaluated on the bands of image blocks.
+
+Bands are named b0, b1... by their index in the image. Expressions are made of numbers, bands, the
+operators + - * / ** and the FUNCTIONS, anything else is rejected when the expression is parsed.
+They can also be compiled into RDA operators, for the server to compute them, see to_rda().
+"""
+import ast
+import operator
+import re
+
+import numpy as np
+
+try:
+    import numexpr
+
+    has_numexpr = True
+except ImportError:
+    has_numexpr = False
+
+BAND = re.compile(r"^b(\d+)$")
+OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+             ast.Pow: operator.pow}
+UNARY = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+FUNCTIONS = {"sqrt": np.sqrt, "abs": np.abs, "log": np.log, "exp": np.exp}
+# the RDA operators of band math, the operators of two images also taking a number as "<name>Const"
+RDA_OPERATORS = {ast.Add: "Add", ast.Sub: "Subtract", ast.Mult: "Multiply", ast.Div: "Divide", ast.Pow: "Power"}
+RDA_FUNCTIONS = {"sqrt": "Sqrt", "abs": "Abs", "log": "Log", "exp": "Exp"}
+# spectral indices, by the image property naming their bands and the expression of those bands
+INDICES = {
+    "ndvi": ("_ndvi_bands", "(b{0} - b{1}) / (b{0} + b{1})"),
+    "ndwi": ("_ndwi_bands", "(b{1} - b{0}) / (b{0} + b{1})"),
+}
+
+
+def _number(node):
+    """ The value of a number literal, None for any other node """
+    # number literals parse as ast.Num before python 3.8 and as ast.Constant since
+    if type(node).__name__ == "Num":
+        value = node.n
+    elif type(node).__name__ == "Constant":
+        value = node.value
+    else:
+        return None
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+class BandExpression(object):
+    """
+    A parsed band math expression.
+
+    Args:
+        source (str): the expression
+
+    Raises:
+        ValueError: the expression is not valid band math
+    """
+
+    def __init__(self, source):
+        self.source = source.strip()
+        try:
+            self._tree = ast.parse(self.source, mode="eval").body
+        except SyntaxError as e:
+            raise ValueError("Invalid band math expression {!r}: {}".format(source, e))
+        used = set()
+        self._check(self._tree, used)
+        self.bands = sorted(used)
+
+    def _check(self, node, used):
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            self._check(node.left, used)
+            self._check(node.right, used)
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in UNARY:
+            self._check(node.operand, used)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+                and len(node.args) == 1 and not node.keywords:
+            self._check(node.args[0], used)
+        elif isinstance(node, ast.Name) and BAND.match(node.id):
+            used.add(int(BAND.match(node.id).group(1)))
+        elif _number(node) is None:
+            raise ValueError("Unsupported {} in band math {!r}".format(type(node).__name__, self.source))
+
+    def evaluate(self, bands):
+        """ Evaluates the expression, with numexpr when it is installed
+
+        Args:
+            bands (dict): the ndarray of every band used, by index
+
+        Returns:
+            ndarray: the result
+        """
+        values = dict(("b{}".format(band), data) for band, data in bands.items())
+        if has_numexpr:
+            return numexpr.evaluate(self.source, local_dict=values)
+        return self._evaluate(self._tree, values)
+
+    def _evaluate(self, node, values):
+        if isinstance(node, ast.BinOp):
+            return OPERATORS[type(node.op)](self._evaluate(node.left, values), self._evaluate(node.right, values))
+        elif isinstance(node, ast.UnaryOp):
+            return UNARY[type(node.op)](self._evaluate(node.operand, values))
+        elif isinstance(node, ast.Call):
+            return FUNCTIONS[node.func.id](self._evaluate(node.args[0], values))
+        elif isinstance(node, ast.Name):
+            return values[node.id]
+        return _number(node)
+
+    def to_rda(self, rda, source, dtype="float32", bands=None):
+        """ Compiles the expression into RDA operators applied to a source node
+
+        Every band used is selected once and cast to float32, numbers become the constants of the
+        "<name>Const" operators and the result is cast to dtype.
+
+        Args:
+            rda (RDA): the operator factory
+            source (Op): the node holding the bands
+            dtype (str): optional. The dtype of the result, default is float32
+            bands (list): optional. The band of source each band index of the expression names, default
+                is the index itself
+
+        Returns:
+            Op: the single band result
+
+        Raises:
+            ValueError: the expression has a part the operators cannot express, such as a number left
+                of - / or **
+        """
+        selected = {}
+
+        def compile_node(node):
+            if isinstance(node, ast.Name):
+                band = int(BAND.match(node.id).group(1))
+                if band not in selected:
+                    node_band = band if bands is None else int(bands[band])
+                    selected[band] = rda.Format(rda.BandSelect(source, bandIndices=[node_band]), dataType="float32")
+                return selected[band]
+            elif isinstance(node, ast.BinOp):
+                name = RDA_OPERATORS[type(node.op)]
+                left, right = _number(node.left), _number(node.right)
+                if left is not None and right is None and isinstance(node.op, (ast.Add, ast.Mult)):
+                    return getattr(rda, name + "Const")(compile_node(node.right), constants=[left])
+                if right is not None and left is None:
+                    return getattr(rda, name + "Const")(compile_node(node.left), constants=[right])
+                return getattr(rda, name)(compile_node(node.left), compile_node(node.right))
+            elif isinstance(node, ast.UnaryOp):
+                operand = compile_node(node.operand)
+                return rda.MultiplyConst(operand, constants=[-1]) if isinstance(node.op, ast.USub) else operand
+            elif isinstance(node, ast.Call):
+                return getattr(rda, RDA_FUNCTIONS[node.func.id])(compile_node(node.args[0]))
+            raise ValueError("RDA operators cannot compute {} of {!r}".format(_number(node), self.source))
+
+        return rda.Format(compile_node(self._tree), dataType=dtype)
+
+    def __repr__(self):
+        return "BandExpression({!r})".format(self.source)
@@ -0,0 +1,539 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from copy import deepcopy
+from functools import partial
+from hashlib import sha256
+from tempfile import mkstemp
+
+import numpy as np
+
+from geogeniustools.rda.fetch.threaded.libcurl import easy, multi
+
+TILE_CACHE_DIR = os.environ.get("GEOGENIUS_TILE_CACHE_DIR", None)
+TILE_CACHE_SIZE = int(os.environ.get("GEOGENIUS_TILE_CACHE_SIZE", 2 ** 30))
+MEMORY_CACHE_SIZE = int(os.environ.get("GEOGENIUS_MEMORY_CACHE_SIZE", 256 * 2 ** 20))
+FETCH_ENGINE = os.environ.get("GEOGENIUS_FETCH_ENGINE", "easy")
+METADATA_CACHE_DIR = os.environ.get("GEOGENIUS_METADATA_CACHE_DIR", None)
+METADATA_CACHE_SIZE = int(os.environ.get("GEOGENIUS_METADATA_CACHE_SIZE", 1024))
+METADATA_CACHE_TTL = float(os.environ.get("GEOGENIUS_METADATA_CACHE_TTL", 0))
+GRAPH_CACHE_DIR = os.environ.get("GEOGENIUS_GRAPH_CACHE_DIR", None)
+
+FETCH_ENGINES = {
+    "easy": easy,
+    "multi": multi
+}
+
+
+def tile_key(rda_id, node_id, x, y, query=""):
+    """ The identity of a RDA tile, independent of the token used to read it """
+    key = "{}/{}/{}/{}".format(rda_id, node_id, x, y)
+    return "{}?{}".format(key, query) if query else key
+
+
+class TileCache(object):
+    """ Base class of the caches that sit between the dask graph of an image and load_url """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the cached tile for the key or None """
+        raise NotImplementedError
+
+    def put(self, key, arr):
+        """ Stores a tile under the key """
+        raise NotImplementedError
+
+    def clear(self):
+        """ Drops every cached tile """
+        raise NotImplementedError
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+class MemoryTileCache(TileCache):
+    """
+    Thread-safe in-memory LRU tile cache bounded by the bytes of the tiles it holds.
+
+    Concurrent fetches of the same missing tile are coalesced: the first caller loads it while
+    the others wait for its result.
+
+    Args:
+        max_bytes (int): the most tile bytes held in memory
+    """
+
+    def __init__(self, max_bytes=MEMORY_CACHE_SIZE):
+        super(MemoryTileCache, self).__init__()
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self._tiles = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._tiles
+
+    def get(self, key):
+        with self._lock:
+            arr = self._tiles.get(key)
+            if arr is not None:
+                self._tiles.move_to_end(key)
+        self._count(arr is not None)
+        return arr
+
+    def put(self, key, arr):
+        if arr.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._tiles[key] = arr
+            self.nbytes += arr.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def fetch(self, key, loader):
+        """
+        Returns the tile for the key, calling loader() to produce it on a miss.
+
+        Args:
+            key (str): the tile key
+            loader (callable): returns the tile ndarray, called at most once per missing key at a time
+
+        Returns:
+            ndarray: the tile
+        """
+        arr = self.get(key)
+        if arr is not None:
+            return arr
+        with self._lock:
+            # a loader may have put the tile between the get() above and taking the lock
+            arr = self._tiles.get(key)
+            if arr is not None:
+                self._tiles.move_to_end(key)
+                self.coalesced += 1
+                return arr
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return pending.result()
+        try:
+            arr = loader()
+            self.put(key, arr)
+            pending.set_result(arr)
+            return arr
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self.nbytes = 0
+
+    @property
+    def stats(self):
+        stats = super(MemoryTileCache, self).stats
+        stats.update(evictions=self.evictions, coalesced=self.coalesced, bytes=self.nbytes)
+        return stats
+
+
+class DiskTileCache(TileCache):
+    """
+    Tile cache persisted on the local filesystem, shared between processes.
+
+    Tiles are stored as .npy files named after the sha256 of their key. Files are written to a
+    temporary name and renamed into place, so concurrent readers never see partial tiles. The
+    modification time of a file is its last use; once the cache grows past max_bytes the least
+    recently used files are removed.
+
+    Args:
+        path (str): directory holding the cache, created if missing
+        max_bytes (int): size budget of the cache directory in bytes
+    """
+
+    def __init__(self, path, max_bytes=TILE_CACHE_SIZE):
+        super(DiskTileCache, self).__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self._unchecked = 0
+        self._evict_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.evict()
+
+    def _file(self, key):
+        digest = sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest[:2], "{}.npy".format(digest))
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def get(self, key):
+        filename = self._file(key)
+        try:
+            arr = np.load(filename, allow_pickle=False)
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError):
+            self._count(False)
+            return None
+        self._count(True)
+        return arr
+
+    def put(self, key, arr):
+        filename = self._file(key)
+        dirname = os.path.dirname(filename)
+        os.makedirs(dirname, exist_ok=True)
+        fd, temp = mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, arr, allow_pickle=False)
+            os.replace(temp, filename)
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        # scanning the directory is expensive, only do it once a slice of the budget was written
+        with self._evict_lock:
+            self._unchecked += arr.nbytes
+            check = self._unchecked > self.max_bytes // 16
+            if check:
+                self._unchecked = 0
+        if check:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith(".npy"):
+                    continue
+                filename = os.path.join(root, name)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, filename))
+        return entries
+
+    @property
+    def size(self):
+        """ Bytes currently stored in the cache directory """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """ Removes least recently used tiles until the cache fits in max_bytes """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                # already evicted by another process
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, filename in self._entries():
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    @property
+    def stats(self):
+        stats = super(DiskTileCache, self).stats
+        stats["bytes"] = self.size
+        return stats
+
+
+_engine = FETCH_ENGINES[FETCH_ENGINE]
+_memory_cache = MemoryTileCache() if MEMORY_CACHE_SIZE > 0 else None
+_tile_cache = DiskTileCache(TILE_CACHE_DIR) if TILE_CACHE_DIR else None
+
+
+def set_fetch_engine(name):
+    """
+    Sets how tiles missing from the caches are fetched.
+
+    Args:
+        name (str): "easy" for one blocking pycurl handle per dask thread, "multi" to multiplex
+            every tile request of the process over a pycurl CurlMulti
+    """
+    global _engine
+    if name not in FETCH_ENGINES:
+        raise ValueError("Unknown fetch engine {}, use one of {}".format(name, ", ".join(FETCH_ENGINES)))
+    _engine = FETCH_ENGINES[name]
+
+
+def set_memory_cache(cache):
+    """
+    Sets the in-memory cache used for RDA tile reads.
+
+    Args:
+        cache (MemoryTileCache): the cache to use, or None to disable in-memory tile caching
+
+    Example:
+        >>> set_memory_cache(MemoryTileCache(max_bytes=512 * 2 ** 20))
+    """
+    global _memory_cache
+    _memory_cache = cache
+
+
+def get_memory_cache():
+    """ Returns the in-memory cache used for RDA tile reads, None when it is disabled """
+    return _memory_cache
+
+
+def set_tile_cache(cache):
+    """
+    Sets the persistent cache used for RDA tile reads, consulted on in-memory cache misses.
+
+    Args:
+        cache (TileCache): the cache to use, or None to disable tile caching
+
+    Example:
+        >>> set_tile_cache(DiskTileCache("/data/geogenius-tiles", max_bytes=10 * 2 ** 30))
+    """
+    global _tile_cache
+    _tile_cache = cache
+
+
+def get_tile_cache():
+    """ Returns the persistent cache used for RDA tile reads, None when it is disabled """
+    return _tile_cache
+
+
+def tile_cache_stats():
+    """
+    Returns the hit/miss statistics of the tile caches.
+
+    Returns:
+        dict: stats of the "memory" and "disk" caches, None for a disabled cache
+    """
+    return {
+        "memory": _memory_cache.stats if _memory_cache is not None else None,
+        "disk": _tile_cache.stats if _tile_cache is not None else None
+    }
+
+
+def _load_tile(key, url, token, shape):
+    cache = _tile_cache
+    if cache is not None:
+        arr = cache.get(key)
+        if arr is not None:
+            return arr
+    arr = _engine.load_url(url, token, shape)
+    if cache is not None:
+        cache.put(key, arr)
+    return arr
+
+
+def load_tile(key, url, token, shape=(8, 256, 256)):
+    """ Loads a tile through the in-memory and persistent tile caches, falling back to fetching the url """
+    loader = partial(_load_tile, key, url, token, shape)
+    cache = _memory_cache
+    if cache is not None:
+        return cache.fetch(key, loader)
+    return loader()
+
+
+def _collect_tile_requests(task, requests):
+    if type(task) is tuple and task:
+        if task[0] is load_tile:
+            key, url, token = task[1:4]
+            if not any(cache is not None and key in cache for cache in (_memory_cache, _tile_cache)):
+                requests.append((url, token))
+        else:
+            for arg in task[1:]:
+                _collect_tile_requests(arg, requests)
+    elif type(task) is list:
+        for arg in task:
+            _collect_tile_requests(arg, requests)
+
+
+def prefetch_tiles(dsk):
+    """
+    Starts fetching the uncached tiles read by the load_tile tasks of a dask graph.
+
+    Only the "multi" fetch engine prefetches; its requests are all in flight at once while the
+    dask threads are still working through the graph.
+
+    Args:
+        dsk (dict): an optimized dask graph
+    """
+    prefetch = getattr(_engine, "prefetch", None)
+    if prefetch is None:
+        return
+    requests = []
+    for task in dsk.values():
+        _collect_tile_requests(task, requests)
+    if requests:
+        prefetch(requests)
+
+
+class MetadataCache(object):
+    """
+    Process wide LRU cache of small JSON documents, optionally persisted on the local filesystem.
+
+    RDA graph ids are content addressed, so what the service returns for one never changes and
+    can be kept for the life of the process, or across processes with a directory.
+
+    Args:
+        max_entries (int): the most documents held in memory
+        ttl (float): optional, seconds after which a document is fetched again
+        path (str): optional, directory persisting the documents as json files
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, "{}.json".format(sha256(key.encode('utf-8')).hexdigest()))
+
+    def _expired(self, stored):
+        return self.ttl is not None and time.time() - stored > self.ttl
+
+    def _load(self, key):
+        filename = self._file(key)
+        try:
+            stored = os.path.getmtime(filename)
+            with open(filename) as f:
+                value = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if self._expired(stored):
+            return None
+        self._remember(key, stored, value)
+        return value
+
+    def _remember(self, key, stored, value):
+        with self._lock:
+            self._entries[key] = (stored, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """ Returns a copy of the document stored under the key, None when missing or expired """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        value = entry[1] if entry is not None else None
+        if value is None and self.path is not None:
+            value = self._load(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return deepcopy(value)
+
+    def put(self, key, value):
+        """ Stores a JSON serializable document under the key """
+        value = deepcopy(value)
+        self._remember(key, time.time(), value)
+        if self.path is not None:
+            fd, temp = mkstemp(dir=self.path, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(value, f)
+                os.replace(temp, self._file(key))
+            except Exception:
+                if os.path.exists(temp):
+                    os.remove(temp)
+                raise
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path is not None:
+            for name in os.listdir(self.path):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.path, name))
+                    except OSError:
+                        pass
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_metadata_cache = MetadataCache(max_entries=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL or None,
+                                path=METADATA_CACHE_DIR) if METADATA_CACHE_SIZE > 0 else None
+
+
+def set_metadata_cache(cache):
+    """
+    Sets the cache of RDA image metadata, keyed by graph id.
+
+    Args:
+        cache (MetadataCache): the cache to use, or None to always fetch metadata
+    """
+    global _metadata_cache
+    _metadata_cache = cache
+
+
+def get_metadata_cache():
+    """ Returns the cache of RDA image metadata, None when it is disabled """
+    return _metadata_cache
+
+
+_graph_cache = MetadataCache(max_entries=METADATA_CACHE_SIZE, path=GRAPH_CACHE_DIR) if METADATA_CACHE_SIZE > 0 else None
+
+
+def set_graph_cache(cache):
+    """
+    Sets the cache of registered RDA graphs, mapping graph content hashes to graph ids.
+
+    Args:
+        cache (MetadataCache): the cache to use, or None to register every graph
+    """
+    global _graph_cache
+    _graph_cache = cache
+
+
+def get_graph_cache():
+    """ Returns the cache of registered RDA graphs, None when it is disabled """
+    return _graph_cache
@@ -2,6 +2,11 @@ class BadRequest(Exception):
     pass
 
 
+# the service refused to register a graph, such as one using operators it does not have
+class GraphRejected(BadRequest):
+    pass
+
+
 class NotAcceptable(Exception):
     pass
 
@@ -40,3 +45,8 @@ class ConvertCogError(Exception):
 
 class PatchSetError(Exception):
     pass
+
+
+# a TypeError for compatibility with callers of the fetch engines that predate it
+class TileFetchError(TypeError):
+    pass
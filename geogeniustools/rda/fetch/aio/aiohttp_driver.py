@@ -0,0 +1,106 @@
+import asyncio
+import os
+
+from dask import optimization
+from dask.core import flatten
+from dask.local import get_sync
+
+try:
+    import aiohttp
+
+    has_aiohttp = True
+except ImportError:
+    has_aiohttp = False
+
+from geogeniustools.rda.cache import load_tile, get_memory_cache, get_tile_cache
+from geogeniustools.rda.fetch.retry import get_retry_policy
+from geogeniustools.rda.fetch.threaded.libcurl.easy import decode_tiff
+from geogeniustools.rda.interface import select_bands
+
+CONCURRENCY = int(os.environ.get("GEOGENIUS_ASYNC_CONCURRENCY", 64))
+
+
+async def load_url(session, url, token, semaphore):
+    """ Loads a geotiff url on the event loop and returns as an ndarray """
+    state = get_retry_policy().attempts(url)
+    while True:
+        retry_after = None
+        try:
+            async with semaphore:
+                async with session.get(url, headers={'X-Auth-Token': token},
+                                       timeout=aiohttp.ClientTimeout(total=state.timeout)) as response:
+                    code = response.status
+                    retry_after = response.headers.get('Retry-After')
+                    data = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            code = 0
+        if code == 200:
+            try:
+                return decode_tiff(data)
+            except Exception:
+                code = None
+        await asyncio.sleep(state.failed(code, retry_after))
+
+
+async def _load_tile(session, semaphore, key, url, token):
+    caches = [cache for cache in (get_memory_cache(), get_tile_cache()) if cache is not None]
+    for cache in caches:
+        arr = cache.get(key)
+        if arr is not None:
+            return arr
+    arr = await load_url(session, url, token, semaphore)
+    for cache in caches:
+        cache.put(key, arr)
+    return arr
+
+
+def _tile_read(task):
+    """ The load_tile task of a task reading a tile and the bands it selects from it, (None, None) for
+    tasks that do not read tiles """
+    if type(task) is tuple and task and task[0] is select_bands:
+        load, _ = _tile_read(task[1])
+        return (load, task[2]) if load is not None else (None, None)
+    if type(task) is tuple and task and task[0] is load_tile:
+        return task, None
+    return None, None
+
+
+async def _read_tile(session, semaphore, load, bands):
+    arr = await _load_tile(session, semaphore, *load[1:4])
+    return arr if bands is None else select_bands(arr, bands)
+
+
+async def compute(darr, concurrency=CONCURRENCY, session=None):
+    """
+    Computes a dask array on the event loop.
+
+    The tiles read by the load_tile tasks of the array, bands selected from them included, are fetched
+    concurrently with aiohttp, at most `concurrency` at a time, then the rest of the graph runs
+    synchronously in the calling thread.
+
+    Args:
+        darr (dask.array.Array): the array to compute
+        concurrency (int): the most tile requests in flight
+        session (aiohttp.ClientSession): optional, a session to reuse across reads
+
+    Returns:
+        ndarray: the computed array
+    """
+    assert has_aiohttp, "To read images asynchronously please install aiohttp"
+    keys = darr.__dask_keys__()
+    dsk, _ = optimization.cull(darr.__dask_graph__(), list(flatten(keys)))
+    tiles = dict((k, read) for k, read in ((k, _tile_read(task)) for k, task in dsk.items()) if read[0] is not None)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency))
+    try:
+        arrs = await asyncio.gather(*[_read_tile(session, semaphore, load, bands) for load, bands in tiles.values()])
+    finally:
+        if own_session:
+            await session.close()
+
+    dsk.update(zip(tiles.keys(), arrs))
+    finalize, args = darr.__dask_postcompute__()
+    return finalize(get_sync(dsk, keys), *args)
@@ -0,0 +1,134 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from geogeniustools.rda.error import TileFetchError
+
+RETRYABLE_CODES = (0, 408, 429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value):
+    """ Returns the seconds to wait from a Retry-After header value, None if it can't be parsed """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class RetryPolicy(object):
+    """
+    How failed tile requests are retried.
+
+    Responses with a code in `retryable_codes` (code 0 stands for a connection error or timeout)
+    and tiles that fail to decode are retried after an exponential backoff with full jitter,
+    other codes fail on the first attempt. A Retry-After header replaces the computed backoff.
+
+    Args:
+        max_retries (int): the most attempts for a single tile
+        backoff (float): the base delay in seconds, doubled after every attempt
+        max_backoff (float): the longest delay between two attempts
+        request_timeout (float): timeout in seconds of a single request
+        deadline (float): the longest time in seconds spent on a tile over all its attempts
+        retryable_codes (tuple): the http codes worth retrying
+        on_retry (callable): optional metrics hook called as on_retry(url, attempt, code, delay)
+    """
+
+    def __init__(self, max_retries=5, backoff=0.1, max_backoff=10.0, request_timeout=60.0, deadline=300.0,
+                 retryable_codes=RETRYABLE_CODES, on_retry=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.request_timeout = request_timeout
+        self.deadline = deadline
+        self.retryable_codes = retryable_codes
+        self.on_retry = on_retry
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def attempts(self, url):
+        """ Returns the retry state of one tile request """
+        return RetryState(self, url)
+
+    def retryable(self, code):
+        return code is None or code in self.retryable_codes
+
+    def delay(self, attempt, retry_after=None):
+        """ Returns the seconds to wait before the next attempt, attempts counting from 1 """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+class RetryState(object):
+    """ Tracks the attempts and the deadline of one tile request under a RetryPolicy """
+
+    def __init__(self, policy, url):
+        self.policy = policy
+        self.url = url
+        self.attempt = 0
+        self.expires = time.time() + policy.deadline
+
+    @property
+    def timeout(self):
+        """ The timeout of the next request, shortened to fit in the deadline """
+        return max(min(self.policy.request_timeout, self.expires - time.time()), 0.001)
+
+    def failed(self, code, retry_after=None):
+        """
+        Records a failed attempt and returns how long to wait before the next one.
+
+        Args:
+            code (int): the http code of the response, 0 for a connection error, None for a tile
+                that could not be decoded
+            retry_after (str): the Retry-After header of the response
+
+        Returns:
+            float: seconds to wait before retrying
+
+        Raises:
+            TileFetchError: when the code is not retryable, the retries are exhausted or the
+                deadline would pass before the next attempt
+        """
+        policy = self.policy
+        self.attempt += 1
+        if not policy.retryable(code) or self.attempt >= policy.max_retries:
+            raise TileFetchError("Request for {} returned unexpected error code: {}".format(self.url, code))
+        delay = policy.delay(self.attempt, parse_retry_after(retry_after))
+        if time.time() + delay >= self.expires:
+            raise TileFetchError("Request for {} returned unexpected error code: {} (deadline exceeded)".format(
+                self.url, code))
+        with policy._lock:
+            policy.retries += 1
+        if policy.on_retry is not None:
+            policy.on_retry(self.url, self.attempt, code, delay)
+        return delay
+
+
+_retry_policy = RetryPolicy(max_retries=int(os.environ.get("GEOGENIUS_MAX_RETRIES", 5)))
+
+
+def set_retry_policy(policy):
+    """
+    Sets the retry policy of tile requests.
+
+    Args:
+        policy (RetryPolicy): the policy used by every fetch engine
+
+    Example:
+        >>> set_retry_policy(RetryPolicy(max_retries=8, deadline=60, on_retry=statsd_increment))
+    """
+    global _retry_policy
+    _retry_policy = policy
+
+
+def get_retry_policy():
+    """ Returns the retry policy of tile requests """
+    return _retry_policy
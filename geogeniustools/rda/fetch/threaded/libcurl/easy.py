@@ -1,63 +1,105 @@
 import os
 from collections import defaultdict
+from io import BytesIO
 import threading
+import time
 from tempfile import NamedTemporaryFile
 try:
     from urlparse import urlparse
 except ImportError:
     from urllib.parse import urlparse
 
-try:
-    from functools import lru_cache # python 3
-except ImportError:
-    from cachetools.func import lru_cache
-
 from skimage.io import imread
 import pycurl
 import numpy as np
 
+from geogeniustools.rda.fetch.retry import get_retry_policy
+
+try:
+    from tifffile import imread as tiff_imread
+except ImportError:
+    try:
+        from skimage.external.tifffile import imread as tiff_imread
+    except ImportError:
+        tiff_imread = None
+
 #import warnings
 #warnings.filterwarnings('ignore')
 
 
-MAX_RETRIES = 5
 _curl_pool = defaultdict(pycurl.Curl)
+_buffer_pool = defaultdict(BytesIO)
+
+
+def _as_bands(arr):
+    """ Moves the band axis of a decoded tile to the front """
+    if len(arr.shape) == 3:
+        return np.rollaxis(arr, 2, 0)
+    return np.expand_dims(arr, axis=0)
+
+
+def decode_tiff_memory(data):
+    """ Decodes geotiff bytes in memory and returns a (bands, rows, cols) ndarray """
+    return _as_bands(tiff_imread(BytesIO(data)))
+
+
+def decode_tiff_file(data, ext=".tif"):
+    """ Decodes geotiff bytes through a temporary file and returns a (bands, rows, cols) ndarray """
+    with NamedTemporaryFile(prefix="geogenius", suffix=ext, delete=False) as temp:
+        temp.write(data)
+    try:
+        return _as_bands(imread(temp.name))
+    finally:
+        os.remove(temp.name)
+
+
+def decode_tiff(data):
+    """ Decodes geotiff bytes, in memory when possible and through a temporary file otherwise """
+    if tiff_imread is not None:
+        try:
+            return decode_tiff_memory(data)
+        except Exception:
+            pass
+    return decode_tiff_file(data)
+
+
+def header_collector(headers):
+    """ Returns a pycurl HEADERFUNCTION storing the response headers in a dict, names lower-cased """
+    def collect(line):
+        line = line.decode('iso-8859-1')
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return collect
 
 
-@lru_cache(maxsize=128)
 def load_url(url, token, shape=(8, 256, 256)):
     """ Loads a geotiff url inside a thread and returns as an ndarray """
-    ext = ".tif"
-    success = False
-    for i in range(MAX_RETRIES):
+    state = get_retry_policy().attempts(url)
+    while True:
         thread_id = threading.current_thread().ident
         _curl = _curl_pool[thread_id]
+        _buffer = _buffer_pool[thread_id]
+        _buffer.seek(0)
+        _buffer.truncate()
+        headers = {}
         _curl.setopt(_curl.URL, url)
         _curl.setopt(pycurl.NOSIGNAL, 1)
+        _curl.setopt(pycurl.TIMEOUT_MS, int(state.timeout * 1000))
         _curl.setopt(pycurl.HTTPHEADER, ['X-Auth-Token: {}'.format(token)])
-        with NamedTemporaryFile(prefix="geogenius", suffix=ext, delete=False) as temp: # TODO: apply correct file extension
-            _curl.setopt(_curl.WRITEDATA, temp.file)
+        _curl.setopt(_curl.WRITEDATA, _buffer)
+        _curl.setopt(pycurl.HEADERFUNCTION, header_collector(headers))
+        try:
             _curl.perform()
             code = _curl.getinfo(pycurl.HTTP_CODE)
+        except pycurl.error:
+            # the connection is in an unknown state, start over with a new handle
+            _curl.close()
+            del _curl_pool[thread_id]
+            code = 0
+        if code == 200:
             try:
-                if(code != 200):
-                    raise TypeError("Request for {} returned unexpected error code: {}".format(url, code))
-                temp.file.flush()
-                temp.close()
-                arr = imread(temp.name)
-                if len(arr.shape) == 3:
-                    arr = np.rollaxis(arr, 2, 0)
-                else:
-                    arr = np.expand_dims(arr, axis=0)
-                success = True
-                return arr
-            except Exception as e:
-                _curl.close()
-                del _curl_pool[thread_id]
-            finally:
-                temp.close()
-                os.remove(temp.name)
-
-    if success is False:
-        raise TypeError("Request for {} returned unexpected error code: {}".format(url, code))
-    return arr
+                return decode_tiff(_buffer.getvalue())
+            except Exception:
+                code = None
+        time.sleep(state.failed(code, headers.get('retry-after')))
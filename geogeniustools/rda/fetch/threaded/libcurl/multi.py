@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from io import BytesIO
+
+import pycurl
+
+from geogeniustools.rda.fetch.retry import get_retry_policy
+from geogeniustools.rda.fetch.threaded.libcurl.easy import decode_tiff, header_collector
+
+MAX_CONNECTIONS = int(os.environ.get("GEOGENIUS_MAX_CONNECTIONS", 256))
+MAX_PREFETCH = int(os.environ.get("GEOGENIUS_MAX_PREFETCH", 1024))
+HTTP2 = os.environ.get("GEOGENIUS_HTTP2", "false").lower() in ("1", "true", "yes")
+
+
+class CurlMultiFetcher(object):
+    """
+    Keeps many tile requests in flight over a single pycurl CurlMulti driven by one background thread.
+
+    Requests are queued with submit() and answered through futures resolving to (http code, body,
+    headers), the code being 0 when the request failed before a response.
+    Finished handles are reused, so connections to the RDA endpoint are kept alive between tiles,
+    and with http2 enabled requests are multiplexed as streams over a few connections.
+
+    Args:
+        max_connections (int): the most requests in flight at a time
+        http2 (bool): negotiate HTTP/2 and multiplex requests over shared connections
+        max_prefetch (int): the most prefetched responses held while waiting to be consumed
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, http2=HTTP2, max_prefetch=MAX_PREFETCH):
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.max_prefetch = max_prefetch
+        self._multi = pycurl.CurlMulti()
+        self._multi.setopt(pycurl.M_MAXCONNECTS, max_connections)
+        if http2:
+            self._multi.setopt(pycurl.M_PIPELINING, pycurl.PIPE_MULTIPLEX)
+        self._handles = []
+        self._active = {}
+        self._queue = deque()
+        self._prefetched = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._thread = None
+
+    def _new_handle(self):
+        _curl = pycurl.Curl()
+        _curl.setopt(pycurl.NOSIGNAL, 1)
+        _curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+        if self.http2:
+            _curl.setopt(pycurl.HTTP_VERSION, pycurl.CURL_HTTP_VERSION_2_0)
+            _curl.setopt(pycurl.PIPEWAIT, 1)
+        return _curl
+
+    def submit(self, url, token, timeout=None):
+        """
+        Queues a request for the url.
+
+        Args:
+            url (str): the tile url
+            token (str): the auth token sent as X-Auth-Token
+            timeout (float): timeout of the request in seconds, defaults to the retry policy's
+
+        Returns:
+            Future: resolves to a tuple of (http code, response body bytes, response headers)
+        """
+        if timeout is None:
+            timeout = get_retry_policy().request_timeout
+        future = Future()
+        with self._lock:
+            self._queue.append((url, token, timeout, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="geogenius-curl-multi")
+                self._thread.daemon = True
+                self._thread.start()
+            self._ready.notify()
+        return future
+
+    def prefetch(self, requests):
+        """
+        Starts fetching tiles ahead of the tasks that will consume them with fetch().
+
+        Args:
+            requests (list): (url, token) tuples, only the first max_prefetch are started
+        """
+        with self._lock:
+            requests = [(url, token) for url, token in requests if url not in self._prefetched]
+        for url, token in requests[:self.max_prefetch]:
+            future = self.submit(url, token)
+            with self._lock:
+                self._prefetched[url] = future
+                while len(self._prefetched) > self.max_prefetch:
+                    self._prefetched.popitem(last=False)
+
+    def fetch(self, url, token, timeout=None):
+        """ Returns (http code, body, headers) for the url, using a prefetched response when there is one """
+        with self._lock:
+            future = self._prefetched.pop(url, None)
+        if future is None:
+            future = self.submit(url, token, timeout=timeout)
+        return future.result()
+
+    def _start(self, url, token, timeout, future):
+        _curl = self._handles.pop() if self._handles else self._new_handle()
+        _buffer = BytesIO()
+        headers = {}
+        _curl.setopt(pycurl.URL, url)
+        _curl.setopt(pycurl.TIMEOUT_MS, int(timeout * 1000))
+        _curl.setopt(pycurl.HTTPHEADER, ['X-Auth-Token: {}'.format(token)])
+        _curl.setopt(pycurl.WRITEDATA, _buffer)
+        _curl.setopt(pycurl.HEADERFUNCTION, header_collector(headers))
+        self._active[_curl] = (_buffer, headers, future)
+        self._multi.add_handle(_curl)
+
+    def _finish(self, _curl, failed=False):
+        self._multi.remove_handle(_curl)
+        _buffer, headers, future = self._active.pop(_curl)
+        if failed:
+            # the connection is in an unknown state, drop the handle
+            future.set_result((0, b"", headers))
+            _curl.close()
+        else:
+            future.set_result((_curl.getinfo(pycurl.HTTP_CODE), _buffer.getvalue(), headers))
+            self._handles.append(_curl)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._active:
+                    self._ready.wait()
+                queued = []
+                while self._queue and len(self._active) + len(queued) < self.max_connections:
+                    queued.append(self._queue.popleft())
+            for request in queued:
+                self._start(*request)
+
+            ret = pycurl.E_CALL_MULTI_PERFORM
+            while ret == pycurl.E_CALL_MULTI_PERFORM:
+                ret, _ = self._multi.perform()
+            while True:
+                remaining, ok, failed = self._multi.info_read()
+                for _curl in ok:
+                    self._finish(_curl)
+                for _curl, errno, errmsg in failed:
+                    self._finish(_curl, failed=True)
+                if remaining == 0:
+                    break
+            if self._active:
+                # the short timeout bounds how long newly queued requests wait to be started
+                self._multi.select(0.01)
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    """ Returns the process wide CurlMultiFetcher, creating it on first use """
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = CurlMultiFetcher()
+    return _fetcher
+
+
+def prefetch(requests):
+    """ Starts fetching (url, token) requests on the process wide fetcher """
+    get_fetcher().prefetch(requests)
+
+
+def load_url(url, token, shape=(8, 256, 256)):
+    """ Loads a geotiff url through the process wide CurlMultiFetcher and returns as an ndarray """
+    fetcher = get_fetcher()
+    state = get_retry_policy().attempts(url)
+    while True:
+        code, data, headers = fetcher.fetch(url, token, timeout=state.timeout)
+        if code == 200:
+            try:
+                return decode_tiff(data)
+            except Exception:
+                code = None
+        time.sleep(state.failed(code, headers.get('retry-after')))
@@ -1,10 +1,16 @@
 import json
 
+from geogeniustools.rda.cache import get_metadata_cache, get_graph_cache
 from geogeniustools.rda.env_variable import RDA_ENDPOINT, MANAGER_ENDPOINT
-from geogeniustools.rda.error import BadRequest, NotFound
+from geogeniustools.rda.error import BadRequest, GraphRejected, NotFound
 
 
 def get_rda_metadata(conn, rda_id):
+    cache = get_metadata_cache()
+    if cache is not None:
+        md = cache.get(rda_id)
+        if md is not None:
+            return md
     md_response = conn.get("{}/rda/meta/{}".format(RDA_ENDPOINT, rda_id))
     if md_response.status_code != 200:
         md_json = md_response.json()
@@ -15,10 +21,13 @@ def get_rda_metadata(conn, rda_id):
                                                                                               rda_id))
     else:
         md_json = md_response.json()
-        return {
+        md = {
             "image": md_json["image"],
             "georef": md_json.get("georef", None)
         }
+        if cache is not None:
+            cache.put(rda_id, md)
+        return md
 
 
 def get_rda_graph(conn, graph_id):
@@ -30,10 +39,29 @@ def get_rda_graph(conn, graph_id):
         raise NotFound("No RDA graph found matching id: {}".format(graph_id))
 
 
-def register_rda_graph(conn, rda_graph):
+def register_rda_graph(conn, rda_graph, content_id=None):
+    """Register a graph and return its graph id
+
+    Args:
+        conn: the session to register with
+        rda_graph (dict): the graph nodes and edges
+        content_id (str): optional content hash of the whole graph, graphs already registered under it are
+            not posted again
+    """
     url = "{}/graph".format(MANAGER_ENDPOINT)
+    cache = get_graph_cache() if content_id is not None else None
+    key = "{}/{}".format(url, content_id)
+    if cache is not None:
+        registered = cache.get(key)
+        if registered is not None:
+            return registered['graphId']
     md_response = conn.post(url, json.dumps(rda_graph, sort_keys=True), headers={'Content-Type': 'application/json'})
     if md_response.status_code == 201:
-        return json.loads(md_response.text)['graphId']
+        graph_id = json.loads(md_response.text)['graphId']
+        if cache is not None:
+            cache.put(key, {'graphId': graph_id})
+        return graph_id
+    elif 400 <= md_response.status_code < 500:
+        raise GraphRejected("Problem registering graph: {}".format(json.loads(md_response.text)['message']))
     else:
         raise BadRequest("Problem registering graph: {}".format(json.loads(md_response.text)['message']))
@@ -1,33 +1,201 @@
 import json
 import uuid
 from collections import OrderedDict
+from collections.abc import Mapping
 from hashlib import sha256
 from itertools import chain
+from numbers import Integral
 
 import requests
 
-from geogeniustools.rda.fetch.threaded.libcurl.easy import load_url
+from geogeniustools.rda.cache import load_tile, tile_key
 from geogeniustools.rda.graph import get_rda_metadata, RDA_ENDPOINT, register_rda_graph
 from geogeniustools.session import get_session
 
 NAMESPACE_UUID = uuid.NAMESPACE_DNS
 
 
+def _read_only(self, *args, **kwargs):
+    raise TypeError("{} is part of a hashed graph node and cannot be changed".format(type(self).__name__))
+
+
+class FrozenList(list):
+    """ A list which cannot be changed, holding the nested lists of a ContentHashedDict """
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = reverse = sort = clear = _read_only
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+
+class FrozenDict(dict):
+    """ A dict which cannot be changed, holding the nested dicts of a ContentHashedDict """
+    __setitem__ = __delitem__ = update = setdefault = pop = popitem = clear = _read_only
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+class FrozenOrderedDict(OrderedDict):
+    """ An OrderedDict which cannot be changed, holding the nested OrderedDicts of a ContentHashedDict """
+    __setitem__ = __delitem__ = update = setdefault = pop = popitem = clear = move_to_end = _read_only
+
+    def __init__(self, items=()):
+        for k, v in OrderedDict(items).items():
+            OrderedDict.__setitem__(self, k, v)
+
+    def __repr__(self):
+        # hashed as the OrderedDict it was made from
+        return repr(OrderedDict(self))
+
+    def __reduce__(self):
+        return type(self), (list(self.items()),)
+
+
+def _frozen(value):
+    """ The value with its nested lists and dicts, which would change under a memoized hash, made read-only """
+    if isinstance(value, OrderedDict):
+        return FrozenOrderedDict((k, _frozen(v)) for k, v in value.items())
+    if isinstance(value, dict):
+        return FrozenDict((k, _frozen(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return FrozenList(_frozen(v) for v in value)
+    return value
+
+
 class ContentHashedDict(dict):
+    """
+    A dict identified by the hash of its content, the "id" key excluded.
+
+    The hash and id are computed once and memoized until the content changes. Nested lists and dicts
+    are stored read-only, since changing them in place would not reset the memo. Nodes reference
+    their ancestors by id, so the id of a node also covers every node upstream of it.
+    """
+    _memo = None
+
+    def __init__(self, *args, **kwargs):
+        super(ContentHashedDict, self).__init__((k, _frozen(v)) for k, v in dict(*args, **kwargs).items())
+
     @property
     def _id(self):
-        _id = str(uuid.uuid5(NAMESPACE_UUID, self.__hash__()))
-        return _id
+        memo = self._memoized()
+        if "id" not in memo:
+            memo["id"] = str(uuid.uuid5(NAMESPACE_UUID, self.__hash__()))
+        return memo["id"]
 
     def __hash__(self):
-        dup = OrderedDict({k: v for k, v in self.items() if k is not "id"})
-        return sha256(str(dup).encode('utf-8')).hexdigest()
+        memo = self._memoized()
+        if "hash" not in memo:
+            dup = OrderedDict({k: v for k, v in self.items() if k != "id"})
+            memo["hash"] = sha256(str(dup).encode('utf-8')).hexdigest()
+        return memo["hash"]
+
+    def _memoized(self):
+        if self._memo is None:
+            self._memo = {}
+        return self._memo
+
+    def _changed(self, *keys):
+        if not keys or any(k != "id" for k in keys):
+            self._memo = None
+
+    def __setitem__(self, key, value):
+        self._changed(key)
+        super(ContentHashedDict, self).__setitem__(key, _frozen(value))
+
+    def __delitem__(self, key):
+        self._changed(key)
+        super(ContentHashedDict, self).__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        self._changed(*other.keys())
+        super(ContentHashedDict, self).update((k, _frozen(v)) for k, v in other.items())
+
+    def setdefault(self, key, default=None):
+        self._changed(key)
+        return super(ContentHashedDict, self).setdefault(key, _frozen(default))
+
+    def pop(self, key, *args):
+        self._changed(key)
+        return super(ContentHashedDict, self).pop(key, *args)
+
+    def popitem(self):
+        self._changed()
+        return super(ContentHashedDict, self).popitem()
+
+    def clear(self):
+        self._changed()
+        super(ContentHashedDict, self).clear()
 
     def populate_id(self):
-        self.update({"id": self._id})
+        if self.get("id") != self._id:
+            # the id is left out of the hash, setting it keeps the memo
+            super(ContentHashedDict, self).__setitem__("id", self._id)
+
+
+class RDATileGraph(Mapping):
+    """
+    The dask graph layer of the tiles of an RDA node.
+
+    Keys are (name, 0, row, col) in the tile grid of the image. The load_tile task of a key is only
+    built when the key is looked up, so culling a slice of a huge image only ever touches the tiles
+    in the slice, and the layer itself costs the same whatever the size of the image.
+    The query, when given, is appended to the url of every tile and is part of its cache key.
+    The bands, when given, are the bands the query asks for, see select_bands().
+    """
+
+    def __init__(self, name, rda_id, node_id, token, chunks, img_md, query="", bands=None):
+        self.name = name
+        self.rda_id = rda_id
+        self.node_id = node_id
+        self.token = token
+        self.chunks = chunks
+        self.query = query
+        self.bands = bands
+        self.min_x = img_md["minTileX"]
+        self.min_y = img_md["minTileY"]
+        self.num_x = img_md["maxTileX"] - self.min_x + 1
+        self.num_y = img_md["maxTileY"] - self.min_y + 1
+
+    def __getitem__(self, key):
+        if not self._owns(key):
+            raise KeyError(key)
+        x, y = key[3] + self.min_x, key[2] + self.min_y
+        task = (load_tile, tile_key(self.rda_id, self.node_id, x, y, self.query),
+                DaskProps._rda_tile(x, y, self.rda_id, self.node_id, self.query), self.token, self.chunks)
+        return task if self.bands is None else (select_bands, task, self.bands)
+
+    def _owns(self, key):
+        try:
+            name, band, row, col = key
+        except (TypeError, ValueError):
+            return False
+        return (name == self.name and band == 0 and isinstance(row, Integral) and isinstance(col, Integral)
+                and 0 <= row < self.num_y and 0 <= col < self.num_x)
+
+    def __contains__(self, key):
+        return self._owns(key)
+
+    def __iter__(self):
+        for row in range(self.num_y):
+            for col in range(self.num_x):
+                yield (self.name, 0, row, col)
+
+    def __len__(self):
+        return self.num_y * self.num_x
+
+
+def select_bands(tile, bands):
+    """ The bands of a tile read with a bands query, selected here when the service sent every band """
+    return tile if tile.shape[0] == len(bands) else tile[list(bands)]
 
 
 class DaskProps(object):
+    # url query of the tile reads, such as "level=1"
+    _query = ""
+    # the bands the query asks for, None for all
+    _bands = None
 
     def graph(self):
         pass
@@ -44,11 +212,8 @@ class DaskProps(object):
     @property
     def dask(self):
         token = self._interface.get_token()
-        _chunks = self.chunks
-        _name = self.name
-        img_md = self.metadata["image"]
-        return {(_name, 0, y - img_md['minTileY'], x - img_md['minTileX']): (load_url, url, token, _chunks)
-                for (y, x), url in self._collect_urls().items()}
+        return RDATileGraph(self.name, self._rda_id, self._id, token, self.chunks, self.metadata["image"],
+                            self._query, self._bands)
 
     @property
     def name(self):
@@ -73,23 +238,16 @@ class DaskProps(object):
                 (img_md["maxTileX"] - img_md["minTileX"] + 1) * img_md["tileXSize"])
 
     @staticmethod
-    def _rda_tile(x, y, rda_id, node_id):
-        return "{}/rda/read/{}/{}/{}/{}.TIF".format(RDA_ENDPOINT, rda_id, node_id, x, y)
-
-    def _collect_urls(self):
-        img_md = self.metadata["image"]
-        rda_id = self._rda_id
-        _id = self._id
-        return {(y, x): self._rda_tile(x, y, rda_id, _id)
-                for y in range(img_md['minTileY'], img_md["maxTileY"] + 1)
-                for x in range(img_md['minTileX'], img_md["maxTileX"] + 1)}
+    def _rda_tile(x, y, rda_id, node_id, query=""):
+        url = "{}/rda/read/{}/{}/{}/{}.TIF".format(RDA_ENDPOINT, rda_id, node_id, x, y)
+        return "{}?{}".format(url, query) if query else url
 
 
 class Op(DaskProps):
     def __init__(self, name, interface=None):
         self._operator = name
-        self._edges = []
-        self._nodes = []
+        # the node and edges of this op, and the subgraphs of its arguments
+        self._subgraph = ([], [], ())
 
         self._rda_id = None  # The graph ID
         self._rda_graph = None  # the RDA graph
@@ -100,27 +258,49 @@ class Op(DaskProps):
 
     @property
     def _id(self):
-        return self._nodes[0]._id
+        return self._subgraph[0][0]._id
+
+    @property
+    def _nodes(self):
+        return self._elements()[0]
+
+    @property
+    def _edges(self):
+        return self._elements()[1]
+
+    def _elements(self):
+        """ The nodes and edges of the graph, the node of this op first, walking a subgraph shared by
+        several arguments only once """
+        nodes, edges, seen = OrderedDict(), OrderedDict(), set()
+        stack = [self._subgraph]
+        while stack:
+            own_nodes, own_edges, parents = stack.pop()
+            if not own_nodes or own_nodes[0]._id in seen:
+                continue
+            seen.add(own_nodes[0]._id)
+            for e in own_nodes:
+                nodes.setdefault(e._id, e)
+            for e in own_edges:
+                edges.setdefault(e._id, e)
+            stack.extend(reversed(parents))
+        return list(nodes.values()), list(edges.values())
 
     def __call__(self, *args, **kwargs):
-        self._nodes = [ContentHashedDict({
+        nodes = [ContentHashedDict({
             "operator": self._operator,
             "_ancestors": [arg._id for arg in args],
             "parameters": OrderedDict({
                 k: json.dumps(v, sort_keys=True) if not isinstance(v, str) else v
                 for k, v in sorted(kwargs.items(), key=lambda x: x[0])})
         })]
-        for arg in args:
-            self._nodes.extend(arg._nodes)
-
-        self._edges = [ContentHashedDict({"index": idx + 1, "source": arg._nodes[0]._id,
-                                          "destination": self._nodes[0]._id})
-                       for idx, arg in enumerate(args)]
-        for arg in args:
-            self._edges.extend(arg._edges)
-
-        for e in chain(self._nodes, self._edges):
+        edges = [ContentHashedDict({"index": idx + 1, "source": arg._id, "destination": nodes[0]._id})
+                 for idx, arg in enumerate(args)]
+        # ancestors were populated when their own ops were applied
+        for e in chain(nodes, edges):
             e.populate_id()
+
+        # the graphs of the arguments are only linked here, and merged when the graph is built
+        self._subgraph = (nodes, edges, tuple(arg._subgraph for arg in args))
         return self
 
     def graph(self, conn=None):
@@ -128,9 +308,10 @@ class Op(DaskProps):
                 self._rda_graph is not None):
             return self._rda_graph
 
-        _nodes = [{k: v for k, v in node.items() if not k.startswith('_')} for node in self._nodes]
+        nodes, edges = self._elements()
+        _nodes = [{k: v for k, v in node.items() if not k.startswith('_')} for node in nodes]
         graph = {
-            "edges": self._edges,
+            "edges": edges,
             "nodes": _nodes
         }
 
@@ -140,7 +321,8 @@ class Op(DaskProps):
 
         if conn is not None:
             # self._rda_id = "obs://obs-tiff-test/retile_china/ng47_05_41.tif"
-            self._rda_id = register_rda_graph(conn, graph)
+            # the root node id hashes the whole graph, its ancestors ids are part of its content
+            self._rda_id = register_rda_graph(conn, graph, content_id=self._id)
             self._rda_graph = graph
             # TODO geogenius: should add node id
             self._rda_meta = get_rda_metadata(conn, self._rda_id)
@@ -14,7 +14,9 @@ from functools import partial
 import os
 
 import dask
-from dask.array import store
+from dask import optimization
+from dask.array import Array, store
+from dask.core import flatten
 import tempfile
 import numpy as np
 from geogeniustools.s3 import S3
@@ -89,10 +91,18 @@ def to_geotiff(arr, path='./output.tif', proj=None, spec=None, bands=None, **kwa
     }
     if proj is not None:
         meta["crs"] = {'init': proj}
+    # a geotiff has a single nodata value for all bands
+    nodata = getattr(arr, "__nodata__", None)
+    if nodata is not None and len(set(nodata)) == 1:
+        meta["nodata"] = nodata[0]
 
     if "tiled" in kwargs and kwargs["tiled"]:
         meta.update(blockxsize=x_size, blockysize=y_size, tiled="yes")
 
+    # store optimizes with the plain dask array optimizations, hand it an already culled graph
+    dsk, _ = optimization.cull(arr.__dask_graph__(), list(flatten(arr.__dask_keys__())))
+    arr = Array(dsk, arr.name, arr.chunks, arr.dtype)
+
     with rasterio.open(path, "w", **meta) as dst:
         writer = rio_writer(dst)
         result = store(arr, writer, compute=False)
@@ -2,6 +2,7 @@ import numpy as np
 from skimage.transform._geometric import GeometricTransform
 from affine import Affine
 from collections import Sequence
+import threading
 import pyproj
 import rasterio
 
@@ -12,10 +13,12 @@ class AffineTransform(GeometricTransform):
         self._iaffine = None
         self.proj = proj
 
-    def rev(self, lng, lat, z=0):
+    def rev(self, lng, lat, z=0, rounded=True):
         if self._iaffine is None:
             self._iaffine = ~self._affine
         px, py = (self._iaffine * (lng, lat))
+        if not rounded:
+            return px, py
         if type(px).__name__ == 'ndarray' and type(py).__name__ == 'ndarray':
             return np.rint(np.asarray(px)), np.rint(np.asarray(py))
         else:
@@ -64,6 +67,21 @@ CUSTOM_PRJ = {
     "EPSG:54008": "+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +ellps=WGS84 +datum=WGS84 +units=m +no_defs"
 }
 
+# pyproj objects are not safe to share between threads on every pyproj release, each thread keeps its own
+_proj_cache = threading.local()
+
+
+def _cached(kind, key, build):
+    cache = _proj_cache.__dict__.setdefault(kind, {})
+    if key not in cache:
+        cache[key] = build()
+    return cache[key]
+
+
+def _crs(prj_code):
+    return CUSTOM_PRJ.get(prj_code, prj_code)
+
+
 def get_proj(prj_code):
     """
       Helper method for handling projection codes that are unknown to pyproj
@@ -72,13 +90,249 @@ def get_proj(prj_code):
           prj_code (str): an epsg proj code
 
       Returns:
-          projection: a pyproj projection
+          projection: a pyproj projection, cached per thread
+    """
+    return _cached("proj", prj_code, lambda: pyproj.Proj(_crs(prj_code)))
+
+
+def get_transformer(from_proj, to_proj):
+    """
+      Returns a pyproj Transformer between two projection codes, cached per thread
+
+      Coordinates are always in x, y order (longitude, latitude for geographic projections), as with
+      the legacy pyproj.transform.
+
+      Args:
+          from_proj (str): the epsg proj code of the source coordinates
+          to_proj (str): the epsg proj code of the destination coordinates
+
+      Returns:
+          transformer: a pyproj Transformer
+    """
+    return _cached("transformer", (from_proj, to_proj),
+                   lambda: pyproj.Transformer.from_crs(_crs(from_proj), _crs(to_proj), always_xy=True))
+
+
+def _control_points(n, step):
+    return np.unique(np.r_[np.arange(0, n, step), n - 1])
+
+
+def _interpolation_weights(points, n):
+    """ Returns the (n, len(points)) matrix interpolating values at points linearly onto range(n) """
+    weights = np.zeros((n, len(points)))
+    if len(points) == 1:
+        weights[:, 0] = 1
+        return weights
+    idx = np.arange(n)
+    k = np.clip(np.searchsorted(points, idx, side='right') - 1, 0, len(points) - 2)
+    t = (idx - points[k]) / (points[k + 1] - points[k]).astype(float)
+    weights[idx, k] = 1 - t
+    weights[idx, k + 1] = t
+    return weights
+
+
+def approx_transform(transform, x, y, error_threshold=0.125, step=16, to_pixels=None):
+    """
+      Transforms the grid of points meshgrid(x, y), evaluating the transform exactly only on a coarse grid
+
+      Like the approximate transformer of GDAL, the transform is evaluated on every `step` rows and columns
+      and interpolated bilinearly in between. Each cell of that control grid is checked at its centre and
+      the midpoints of its edges, and the cells off by more than error_threshold there are split in four
+      and checked again, down to cells of a few pixels which are transformed exactly.
+
+      Args:
+          transform (callable): maps x and y arrays to transformed x and y arrays, like Transformer.transform
+          x (ndarray): the x coordinates of the grid columns
+          y (ndarray): the y coordinates of the grid rows
+          error_threshold (float): the largest error allowed, 0 transforms every point exactly
+          step (int): the rows and columns between control points
+          to_pixels (callable): optional. maps transformed x and y to the space the error is measured in,
+              usually the pixels of the source image
+
+      Returns:
+          tuple: the transformed x and y grids, shaped (len(y), len(x))
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    rows, cols = _control_points(len(y), step), _control_points(len(x), step)
+    if error_threshold <= 0 or len(y) * len(x) <= 2 * len(rows) * len(cols):
+        return transform(*np.meshgrid(x, y, indexing='xy'))
+
+    cx, cy = transform(*np.meshgrid(x[cols], y[rows], indexing='xy'))
+    wy, wx = _interpolation_weights(rows, len(y)), _interpolation_weights(cols, len(x))
+    tx, ty = wy.dot(cx).dot(wx.T), wy.dot(cy).dot(wx.T)
+
+    mid_rows, mid_cols = (rows[:-1] + rows[1:]) // 2, (cols[:-1] + cols[1:]) // 2
+    # the centres of the cells, the midpoints of their top and bottom edges and of their left and right edges
+    refine = np.zeros((len(mid_rows), len(mid_cols)), dtype=bool)
+    for check_rows, check_cols in ((mid_rows, mid_cols), (rows, mid_cols), (mid_rows, cols)):
+        ex, ey = transform(*np.meshgrid(x[check_cols], y[check_rows], indexing='xy'))
+        failed = ~_within(to_pixels, ex, ey, tx[np.ix_(check_rows, check_cols)], ty[np.ix_(check_rows, check_cols)],
+                          error_threshold)
+        if len(check_rows) > len(mid_rows):
+            failed = failed[:-1] | failed[1:]
+        if len(check_cols) > len(mid_cols):
+            failed = failed[:, :-1] | failed[:, 1:]
+        refine |= failed
+    cells = np.array([(rows[i], rows[i + 1], cols[j], cols[j + 1]) for i, j in zip(*np.nonzero(refine))], dtype=np.intp)
+    _refine_cells(transform, x, y, tx, ty, cells.reshape(-1, 4), error_threshold, to_pixels)
+    return tx, ty
+
+
+def _within(to_pixels, ex, ey, ax, ay, error_threshold):
+    """ Whether the approximated points are within error_threshold of the exact ones """
+    if to_pixels is not None:
+        (ex, ey), (ax, ay) = to_pixels(ex, ey), to_pixels(ax, ay)
+    # points outside the domain of the projection come out as inf or nan, refine them too
+    return np.hypot(ex - ax, ey - ay) <= error_threshold
+
+
+def _bilinear(t, r0, r1, c0, c1, v, u):
+    """ Interpolates the grid t between the corners of cells, at the fractions v, u of their rows and columns """
+    return (1 - v) * ((1 - u) * t[r0, c0] + u * t[r0, c1]) + v * ((1 - u) * t[r1, c0] + u * t[r1, c1])
+
+
+def _cell_points(cells):
+    """ The cell index, row and column of every point of the cells (r0, r1, c0, c1), edges included """
+    heights, widths = cells[:, 1] - cells[:, 0] + 1, cells[:, 3] - cells[:, 2] + 1
+    sizes = heights * widths
+    cell = np.repeat(np.arange(len(cells)), sizes)
+    offset = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return cell, cells[cell, 0] + offset // widths[cell], cells[cell, 2] + offset % widths[cell]
+
+
+def _refine_cells(transform, x, y, tx, ty, cells, error_threshold, to_pixels, min_size=4):
+    """
+      Splits the cells (r0, r1, c0, c1) of the grids, which have exact corners, in four cells interpolated
+      from their exact corners, until each is within error_threshold at its centre and the midpoints of its
+      edges. The cells of every level are checked with a single call of the transform.
     """
-    if prj_code in CUSTOM_PRJ:
-        proj = pyproj.Proj(CUSTOM_PRJ[prj_code])
+    while len(cells):
+        small = (cells[:, 1] - cells[:, 0] <= min_size) | (cells[:, 3] - cells[:, 2] <= min_size)
+        exact, cells = cells[small], cells[~small]
+        r0, r1, c0, c1 = [c[:, None] for c in cells.T]
+        rm, cm = (r0 + r1) // 2, (c0 + c1) // 2
+        point_rows = np.hstack([rm, r0, r1, rm, rm])
+        point_cols = np.hstack([cm, cm, cm, c0, c1])
+        ex, ey = [np.reshape(e, point_rows.shape) for e in transform(x[point_cols.ravel()], y[point_rows.ravel()])]
+        v, u = (point_rows - r0) / (r1 - r0).astype(float), (point_cols - c0) / (c1 - c0).astype(float)
+        ax, ay = [_bilinear(t, r0, r1, c0, c1, v, u) for t in (tx, ty)]
+        ok = np.all(_within(to_pixels, ex, ey, ax, ay, error_threshold), axis=1)
+        cell, fill_rows, fill_cols = _cell_points(cells[ok])
+        a, b, c, d = cells[ok][cell].T
+        v, u = (fill_rows - a) / (b - a).astype(float), (fill_cols - c) / (d - c).astype(float)
+        for t in (tx, ty):
+            t[fill_rows, fill_cols] = _bilinear(t, a, b, c, d, v, u)
+        # the cells split next, and the cells too small to split, are written last so their exact points win
+        failed = ~ok
+        tx[point_rows[failed], point_cols[failed]] = ex[failed]
+        ty[point_rows[failed], point_cols[failed]] = ey[failed]
+        if len(exact):
+            _, exact_rows, exact_cols = _cell_points(exact)
+            tx[exact_rows, exact_cols], ty[exact_rows, exact_cols] = transform(x[exact_cols], y[exact_rows])
+        r0, r1, c0, c1, rm, cm = [c[failed, 0] for c in (r0, r1, c0, c1, rm, cm)]
+        cells = np.concatenate([np.stack(cell, axis=1) for cell in
+                                ((r0, rm, c0, cm), (r0, rm, cm, c1), (rm, r1, c0, cm), (rm, r1, cm, c1))])
+
+
+RESAMPLING = ("nearest", "bilinear", "cubic", "average", "mode")
+# the most samples taken along each axis of an output pixel by the average and mode resampling
+MAX_SUPERSAMPLING = 8
+
+
+def _taps(coord, method, size):
+    """ Returns the source indices and weights along one axis of each sample at the coordinates """
+    if method == "nearest":
+        return [np.clip(np.rint(coord), 0, size - 1).astype(np.intp)], [1]
+    base = np.floor(coord)
+    t = coord - base
+    if method == "bilinear":
+        offsets, weights = (0, 1), [1 - t, t]
     else:
-        proj = pyproj.Proj(init=prj_code)
-    return proj
+        # cubic convolution with a = -0.5, the cubic kernel of GDAL
+        offsets, weights = (-1, 0, 1, 2), [((-0.5 * t + 1) * t - 0.5) * t, (1.5 * t - 2.5) * t * t + 1,
+                                            ((-1.5 * t + 2) * t + 0.5) * t, (0.5 * t - 0.5) * t * t]
+    return [np.clip(base + o, 0, size - 1).astype(np.intp) for o in offsets], weights
+
+
+def resample(data, coords, method="cubic", out=None, dtype=None):
+    """
+      Samples every band of an image at the same fractional pixel coordinates
+
+      The indices and weights of the kernel are computed once for all bands, and samples past the edges
+      of the image take the value of the nearest edge pixel. "average" and "mode" sample each output pixel
+      on a grid spanning its footprint in the source, as many samples along each axis as source pixels it
+      spans (up to MAX_SUPERSAMPLING), and take their mean or most frequent value.
+
+      Args:
+          data (ndarray): the (bands, rows, cols) image to sample
+          coords (ndarray): the (2, height, width) row and column coordinates in data of each output pixel
+          method (str): one of "nearest", "bilinear", "cubic", "average" or "mode"
+          out (ndarray): optional. the (bands, height, width) array to write the samples to
+          dtype: optional. the dtype of the output when out is not given, defaults to the dtype of data
+
+      Returns:
+          ndarray: the (bands, height, width) samples, rounded and clipped to the range of integer dtypes
+    """
+    if method not in RESAMPLING:
+        raise ValueError("unsupported resampling method {}, expected one of {}".format(method, RESAMPLING))
+    if out is None:
+        out = np.empty((data.shape[0],) + coords.shape[1:], dtype=dtype or data.dtype)
+    if method in ("average", "mode"):
+        return _supersample(data, coords, method, out)
+    rows, row_weights = _taps(coords[0], method, data.shape[1])
+    cols, col_weights = _taps(coords[1], method, data.shape[2])
+    # gather from the flattened bands, one take per kernel tap for all bands
+    flat, width = data.reshape(data.shape[0], -1), data.shape[2]
+    if method == "nearest":
+        np.take(flat, rows[0] * width + cols[0], axis=1, out=out)
+        return out
+
+    acc = np.zeros(out.shape, dtype=np.result_type(data.dtype, np.float32))
+    samples = np.empty(out.shape, dtype=data.dtype)
+    col_weights = [weight.astype(acc.dtype) for weight in col_weights]
+    for row, row_weight in zip(rows, row_weights):
+        offset, row_weight = row * width, row_weight.astype(acc.dtype)
+        for col, col_weight in zip(cols, col_weights):
+            np.take(flat, offset + col, axis=1, out=samples)
+            acc += (row_weight * col_weight) * samples
+    return _store(acc, out)
+
+
+def _store(acc, out):
+    if np.issubdtype(out.dtype, np.integer):
+        info = np.iinfo(out.dtype)
+        np.clip(np.rint(acc, out=acc), info.min, info.max, out=acc)
+    out[...] = acc
+    return out
+
+
+def _supersample(data, coords, method, out):
+    """ Averages, or takes the mode of, nearest samples spread over the source footprint of each output pixel """
+    # the change of the coordinates from one output pixel to the next, along output rows and columns
+    steps = [np.gradient(coords, axis=axis) if coords.shape[axis] > 1 else np.zeros_like(coords)
+             for axis in (1, 2)]
+    spans = [np.hypot(*step) for step in steps]
+    k = int(np.clip(np.ceil(np.median(np.maximum(*spans))) if spans[0].size else 1, 1, MAX_SUPERSAMPLING))
+    offsets = (np.arange(k) + 0.5) / k - 0.5
+    samples = [resample(data, coords + u * steps[0] + v * steps[1], "nearest")
+               for u in offsets for v in offsets]
+    if method == "average":
+        acc = np.zeros(out.shape, dtype=np.result_type(data.dtype, np.float32))
+        for sample in samples:
+            acc += sample
+        return _store(acc / len(samples), out)
+
+    # the mode is the value of the longest run of equal values once the samples are sorted
+    samples = np.sort(np.stack(samples), axis=0)
+    best, best_count, count = samples[0].copy(), np.ones(out.shape, dtype=np.intp), np.ones(out.shape, dtype=np.intp)
+    for previous, sample in zip(samples[:-1], samples[1:]):
+        count = np.where(sample == previous, count + 1, 1)
+        longer = count > best_count
+        best[longer] = sample[longer]
+        np.maximum(best_count, count, out=best_count)
+    out[...] = best
+    return out
+
 
 def pad(array, transform, pad_width, mode='constant', **kwargs):
     """pad array and adjust affine transform matrix.
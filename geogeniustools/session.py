@@ -1,26 +1,66 @@
 import os
+import threading
+import time
+from datetime import datetime
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from geogeniustools.rda.env_variable import USER_ENDPOINT
 from geogeniustools.rda.error import AkSkNotFound
 
+# lifetime assumed for tokens whose expiry is not reported by the user service
+TOKEN_LIFETIME = int(os.environ.get("GEOGENIUS_TOKEN_LIFETIME", 3600))
+# tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = int(os.environ.get("GEOGENIUS_TOKEN_REFRESH_MARGIN", 300))
+# connections kept open per host by the pooled http client
+POOL_SIZE = int(os.environ.get("GEOGENIUS_POOL_SIZE", 64))
+# retries of connection errors and 502/503/504 responses on idempotent requests
+HTTP_RETRIES = int(os.environ.get("GEOGENIUS_HTTP_RETRIES", 3))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
 
 def get_session():
-    if os.environ.get("ACCESS_KEY", None) and os.environ.get("SECRET_KEY", None):
-        return GeogeniusSession(access_key=os.environ.get("ACCESS_KEY"), secret_key=os.environ.get("SECRET_KEY"))
+    """Return the session of the ACCESS_KEY/SECRET_KEY in the environment, shared by every caller"""
+    access_key, secret_key = os.environ.get("ACCESS_KEY", None), os.environ.get("SECRET_KEY", None)
+    if access_key and secret_key:
+        with _sessions_lock:
+            if (access_key, secret_key) not in _sessions:
+                _sessions[(access_key, secret_key)] = GeogeniusSession(access_key=access_key, secret_key=secret_key)
+            return _sessions[(access_key, secret_key)]
     else:
         raise AkSkNotFound("ACCESS_KEY or SECRET_KEY not set in environment")
 
 
+def pooled_client(pool_size=POOL_SIZE, max_retries=HTTP_RETRIES):
+    """Return a requests.Session keeping up to pool_size connections alive per host"""
+    retry = Retry(total=max_retries, connect=max_retries, read=max_retries, backoff_factor=0.2,
+                  status_forcelist=(502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    client = requests.Session()
+    client.mount("http://", adapter)
+    client.mount("https://", adapter)
+    return client
+
+
 class GeogeniusSession:
 
-    def __init__(self, client=requests, token=None, access_key=None, secret_key=None):
-        self._client = client
+    def __init__(self, client=None, token=None, access_key=None, secret_key=None, pool_size=POOL_SIZE,
+                 max_retries=HTTP_RETRIES):
+        # a pooled requests.Session reuses connections across calls and threads, pass client=requests to
+        # open a new connection per request
+        self._client = client if client is not None else pooled_client(pool_size, max_retries)
         self.token = token
         self.access_key = access_key
         self.secret_key = secret_key
         self.check_token_url = "{}/users/credentials".format(USER_ENDPOINT)
         self.refresh_token_url = "{}/users/credentials/login".format(USER_ENDPOINT)
+        # None until the token has been validated or obtained, then the epoch time it expires at
+        self.token_expires = None
+        self._token_lock = threading.Lock()
 
     def _add_token(self, headers=None):
         """add token in headers"""
@@ -41,23 +81,63 @@ class GeogeniusSession:
         data = {"ak": self.access_key, "sk": self.secret_key}
         res = self._client.post(self.refresh_token_url, headers=headers, json=data)
         res.raise_for_status()
-        self.token = res.json()["token"]
+        body = res.json()
+        self.token = body["token"]
+        self.token_expires = self._parse_expiry(body)
+
+    @staticmethod
+    def _parse_expiry(body):
+        """read the token expiry from a login response, assuming TOKEN_LIFETIME when it is missing"""
+        try:
+            if "expires_at" in body:
+                expires_at = body["expires_at"].replace("Z", "+00:00")
+                return datetime.fromisoformat(expires_at).timestamp()
+            if "expires_in" in body:
+                return time.time() + float(body["expires_in"])
+        except (AttributeError, TypeError, ValueError):
+            pass
+        return time.time() + TOKEN_LIFETIME
+
+    def _token_expiring(self):
+        return self.token_expires is None or time.time() >= self.token_expires - TOKEN_REFRESH_MARGIN
 
     def get_token(self):
-        """Return a valid token"""
-        if not self._check_token_valid():
-            self._refresh_token()
+        """Return a valid token
+
+        The token is validated against the user service only when its expiry is unknown, and is
+        refreshed once it is about to expire. Concurrent callers wait for a single refresh.
+        """
+        if not self._token_expiring():
+            return self.token
+        with self._token_lock:
+            if self._token_expiring():
+                if self.token is not None and self.token_expires is None and self._check_token_valid():
+                    self.token_expires = time.time() + TOKEN_LIFETIME
+                else:
+                    self._refresh_token()
         return self.token
 
+    def invalidate_token(self, token=None):
+        """Force the next get_token to revalidate, unless the token was already replaced by another one"""
+        with self._token_lock:
+            if token is None or token == self.token:
+                self.token_expires = None
+
     def _add_valid_token(self, headers):
         """check token is valid, if valid, add token in headers, if not, refresh token and add"""
-        if not self._check_token_valid():
-            self._refresh_token()
+        self.get_token()
         return self._add_token(headers=headers)
 
     def request(self, url, method="get", data=None, json=None, headers=None, **kwargs):
         headers = self._add_valid_token(headers)
-        return self._client.request(method, url, data=data, json=json, headers=headers, **kwargs)
+        token = headers['X-Auth-Token']
+        res = self._client.request(method, url, data=data, json=json, headers=headers, **kwargs)
+        if res.status_code == 401:
+            # the token was revoked or expired early, revalidate it and retry once
+            self.invalidate_token(token)
+            headers = self._add_valid_token(headers)
+            res = self._client.request(method, url, data=data, json=json, headers=headers, **kwargs)
+        return res
 
     def get(self, url, **kwargs):
         return self.request(url, method="get", **kwargs)